@@ -1,38 +1,132 @@
-from flask import Flask, request, send_file, make_response, jsonify, session
+from flask import Flask, request, send_file, make_response, jsonify, session, Response, stream_with_context, g
 from flask_cors import CORS
 import requests
 import os
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from io import BytesIO
+import json
+import hashlib
+import math
+import queue
 import time
+import uuid
+import zipfile
 from dotenv import load_dotenv
-import asyncio
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from models.gemini2_vision_model import Gemini2VisionModel
+from models.gemini2_vision_model import Gemini2VisionModel, ERROR_DIAGNOSES
 from models.gemini2_chat_model import Gemini2ChatModel
+from utils.async_runner import get_loop, run_async, submit_async, iterate_async
+from utils.batch import AsyncRateLimiter, fan_out, BATCH_DONE
+from utils.report_store import ReportStore
+from utils.history_store import HistoryStore, parse_time
+from utils.uploads import UploadRequest, read_upload
+from utils.job_queue import InvalidWebhookError, JobQueue, QueueFullError
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.image_quality import ImageQualityError
+from utils.pdf_report import render_report
+from utils.upstream import upstream_stats
+from utils.metrics import REGISTRY, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, STAGE_LATENCY, ANALYZE_ERRORS
+from utils.logging_config import configure_logging, get_logger
+from utils.lifecycle import Lifecycle
 
 # Load environment variables
 load_dotenv()
+configure_logging()
+log = get_logger("app")
+
+# startup timing, readiness and draining for this worker process
+lifecycle = Lifecycle()
 
 # Configuration
 port = os.getenv('PORT', 5050)
 app = Flask(__name__)
 CORS(app) 
 
+# reject oversized uploads before reading them; large file parts are spooled to disk and memory-mapped
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv('BATCH_MAX_UPLOAD_BYTES', 256 * 1024 * 1024))
+
 # create an instance of the gemini-4 Vision model
 gemini2_vision_model = Gemini2VisionModel()
 
 # create an instance of the gemini-2 Chat model
 gemini2_chat_model = Gemini2ChatModel()
 
-async def ai_response(image_data: bytes, prompt: str, plant_type: str, plant_species: str) -> dict:
+# bounded, expiring store for PDF reports; PDFs are rendered on first download, not per analysis
+report_store = ReportStore(renderer=render_report)
+
+# every successful diagnosis, with its image, for the plant library
+history_store = HistoryStore()
+
+# async job mode for /analyze: 'request' (per-request opt-in) or 'always'
+ANALYZE_JOB_MODE = os.getenv('ANALYZE_JOB_MODE', 'request').lower()
+
+# per-client token buckets, a global cap on concurrent Gemini work and priority lanes, shared
+# by every worker process; see README "Admission Control"
+admission = AdmissionController()
+ADMISSION_TRUST_PROXY = os.getenv('ADMISSION_TRUST_PROXY', 'false').lower() in ('1', 'true', 'yes')
+
+# batch limits; the rate limiter is shared by every batch so the process stays under upstream quota
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', 500))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 8))
+BATCH_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+batch_rate_limiter = AsyncRateLimiter(
+    float(os.getenv('BATCH_RATE_LIMIT', 0)),
+    burst=int(os.getenv('BATCH_RATE_BURST', BATCH_MAX_CONCURRENCY))
+)
+
+# gauges for components that keep their own counters, refreshed on every /metrics scrape
+CACHE_STATS = REGISTRY.gauge("diagnosis_cache", "Diagnosis cache counters and size", ("stat",))
+REPORT_STATS = REGISTRY.gauge("report_store", "Report store counters and size", ("stat",))
+SINGLE_FLIGHT_STATS = REGISTRY.gauge("analyze_single_flight", "Diagnoses started vs. coalesced onto an in-flight call", ("stat",))
+ADMISSION_STATS = REGISTRY.gauge("admission", "Admission slots in use and capacity by lane, and tracked clients", ("stat",))
+JOB_STATS = REGISTRY.gauge("job_queue", "Jobs by status in the analyze job queue", ("stat",))
+UPSTREAM_BREAKER_OPEN = REGISTRY.gauge("upstream_circuit_open", "1 if the upstream's circuit breaker is open", ("upstream",))
+UPSTREAM_RETRIES = REGISTRY.gauge("upstream_retries", "Retries made against the upstream since startup", ("upstream",))
+CHAT_SESSIONS = REGISTRY.gauge("chat_sessions", "Live chat sessions")
+
+def collect_component_stats():
+    for stat, value in gemini2_vision_model.cache.stats().items():
+        CACHE_STATS.set(float(value), stat=stat)
+    for stat, value in gemini2_vision_model.inflight.stats().items():
+        SINGLE_FLIGHT_STATS.set(float(value), stat=stat)
+    for stat, value in report_store.stats().items():
+        REPORT_STATS.set(float(value), stat=stat)
+    for name, stats in upstream_stats().items():
+        UPSTREAM_BREAKER_OPEN.set(1 if stats['state'] == 'open' else 0, upstream=name)
+        UPSTREAM_RETRIES.set(stats['retries'], upstream=name)
+    CHAT_SESSIONS.set(gemini2_chat_model.sessions.stats()['sessions'])
+    for stat, value in job_queue.stats().items():
+        JOB_STATS.set(float(value), stat=stat)
+    for stat, value in admission.stats().items():
+        ADMISSION_STATS.set(float(value), stat=stat)
+
+REGISTRY.add_collector(collect_component_stats)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # teardown runs after streamed responses finish, so this covers the whole stream
+    if 'request_started' in g:
+        REQUESTS_IN_FLIGHT.dec(endpoint=g.metrics_endpoint)
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, endpoint=g.metrics_endpoint)
+    if 'admission' in g:
+        g.admission.release()
+
+async def ai_response(image_data, prompt: str, plant_type: str, plant_species: str) -> dict:
     try:
-        image_file_stream = BytesIO(image_data)
-        analysis_results = await gemini2_vision_model.analyze_image(image_file_stream, prompt, plant_type, plant_species)
+        analysis_results = await gemini2_vision_model.analyze_image(image_data, prompt, plant_type, plant_species)
         return analysis_results
+    except ImageQualityError:
+        raise # the photo itself is unusable; callers report it to the user
     except Exception as e:
-        print(f"Error analyzing image: {e}")
+        log.error("error analyzing image", extra={"error": str(e)})
+        ANALYZE_ERRORS.inc(category="service_error")
         return {
             "disease_detected": "Service Error",
             "confidence": "0%",
@@ -42,60 +136,56 @@ async def ai_response(image_data: bytes, prompt: str, plant_type: str, plant_spe
             "extra_info": "Unknown"
         }
 
-def generate_pdf_report(analysis_results: dict) -> BytesIO:
-    """Generate a PDF report from the AI model's analysis results."""
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    
-    # Add title
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, 750, "Plant Disease Diagnostic Report")
-    
-    # Add timestamp
-    c.setFont("Helvetica", 10)
-    c.drawString(50, 730, f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # Add analysis results
-    c.setFont("Helvetica", 12)
-    y_position = 700
-    
-    # Add each result to the PDF
-    for key, value in analysis_results.items():
-        # Ensure the key is a string for drawing
-        key_str = str(key).replace("_", " ").title()
-        
-        if isinstance(value, list):
-            c.drawString(50, y_position, f"{key_str}:")
-            y_position -= 15 # Smaller gap for list title
-            for item in value:
-                # Handle potentially long list items with wrap or truncation if needed
-                item_str = str(item)
-                # Basic wrap, you might need a more sophisticated text wrapping solution
-                if len(item_str) > 80: # Simple check
-                     item_str = item_str[:77] + "..."
-                c.drawString(70, y_position, f"• {item_str}")
-                y_position -= 15
-                if y_position < 50: # Page break if too low
-                    c.showPage()
-                    c.setFont("Helvetica", 12)
-                    y_position = 750
-        else:
-            value_str = str(value)
-            # Basic wrap
-            if len(value_str) > 70: # Simple check
-                value_str = value_str[:67] + "..."
-
-            c.drawString(50, y_position, f"{key_str}: {value_str}")
-            y_position -= 20
-        if y_position < 50: # Page break
-            c.showPage()
-            c.setFont("Helvetica", 12)
-            y_position = 750
-            
-    c.save()
-    buffer.seek(0)
-    return buffer
+def warm_up(started_at: float = None):
+    """
+    Get this worker ready for traffic: start the event loop, exercise the image pipeline and open
+    upstream connections, then report how long startup took. The production server calls this
+    after forking each worker; `started_at` is the fork time.
+    """
+    if started_at is not None:
+        lifecycle.restart_clock(started_at)
+    lifecycle.phase_done("init") # imports and client construction
+
+    get_loop()
+    try:
+        run_async(gemini2_vision_model.warm_up(upstreams=os.getenv('WARMUP_UPSTREAMS', 'true').lower() in ('1', 'true', 'yes')),
+                  timeout=float(os.getenv('WARMUP_TIMEOUT', 15)))
+    except Exception as e:
+        log.warning("warmup did not finish", extra={"error": str(e)})
+    lifecycle.phase_done("warmup")
 
+    lifecycle.mark_ready()
+    log.info("worker ready", extra={"pid": os.getpid(), "startup_seconds": lifecycle.status()['startup_seconds']})
+
+def begin_drain():
+    """
+    Stop advertising readiness and stop claiming queued jobs; in-flight requests keep running
+    """
+    if lifecycle.draining:
+        return
+    lifecycle.start_draining()
+    job_queue.stop(timeout=0)
+    log.info("worker draining", extra={"pid": os.getpid()})
+
+def shutdown(timeout: float = None):
+    """
+    Wait up to `timeout` seconds for running jobs, after the server has finished in-flight requests,
+    then finish writing history
+    """
+    begin_drain()
+    job_queue.stop(timeout)
+    history_store.close()
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    response = jsonify({'error': str(e), 'reason': e.reason})
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, 429
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit = request.max_content_length
+    return jsonify({'error': f'Upload too large (max {limit} bytes)' if limit else 'Upload too large'}), 413
 
 @app.route('/')
 def landing_page():
@@ -106,18 +196,105 @@ def chat():
     if request.method == 'OPTIONS':
         response = make_response(('', 200))
         response.headers.add('Access-Control-Allow-Origin', '*') # Be more specific in production
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Session-Id')
         response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
         return response
     
     try:
+        _admit('interactive')
         message = request.json.get('message', '')
-        response = gemini2_chat_model.chat(message)
-        print(f"Response: {response}")
-        return jsonify({'response': response})
+        # each conversation keeps its own history; clients echo back the session_id we return
+        session_id = request.json.get('session_id') or request.headers.get('X-Session-Id') or uuid.uuid4().hex
+
+        # stream tokens as Server-Sent Events when the client asks for it
+        if request.json.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            return Response(
+                stream_with_context(_chat_event_stream(message, session_id)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        response = run_async(gemini2_chat_model.chat(message, session_id))
+        log.debug("chat response", extra={"session_id": session_id, "response": response})
+        return jsonify({'response': response, 'session_id': session_id})
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _chat_event_stream(message: str, session_id: str):
+    """
+    SSE stream for /chat: a `session` event, one `data` event per text chunk, then `done` (or `error`)
+    """
+    yield f"event: session\ndata: {json.dumps({'session_id': session_id})}\n\n"
+    try:
+        for text in iterate_async(gemini2_chat_model.chat_stream(message, session_id)):
+            yield f"data: {json.dumps({'text': text})}\n\n"
+    except Exception as e:
+        log.error("Gemini Chat stream error", extra={"error": str(e), "session_id": session_id})
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+def _analysis_error(gemini_response):
+    """
+    Return a short description of the error if the analysis failed, or None if it succeeded
+    """
+    if not isinstance(gemini_response, dict):
+        return "Unknown service error."
+    if gemini_response.get('disease_detected') != "Service Error" and "Error" not in str(gemini_response.get('recommendations', '')):
+        return None
+    if isinstance(gemini_response.get('recommendations'), list) and gemini_response['recommendations']:
+        return str(gemini_response['recommendations'][0])
+    if 'disease_detected' in gemini_response:
+        return str(gemini_response['disease_detected'])
+    return "Unknown service error."
+
+def _client_key(req) -> str:
+    """
+    Rate-limit key for a request: a hash of its API key (X-API-Key or a Bearer token), else its IP
+    """
+    api_key = req.headers.get('X-API-Key', '')
+    authorization = req.headers.get('Authorization', '')
+    if not api_key and authorization.lower().startswith('bearer '):
+        api_key = authorization[7:].strip()
+    if api_key:
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+    address = req.access_route[0] if ADMISSION_TRUST_PROXY and req.access_route else req.remote_addr
+    return f'ip:{address}'
+
+def _admit(lane: str, slots: int = 1):
+    """
+    Admit the current request or raise AdmissionRejected (answered with 429). The slots are
+    released in teardown, which for streamed responses runs after the stream ends.
+    """
+    g.admission = admission.admit(_client_key(request), lane=lane, slots=slots)
+    return g.admission
+
+def _wants_job(req) -> bool:
+    if ANALYZE_JOB_MODE == 'always':
+        return True
+    flag = req.form.get('async') or req.args.get('async') or ''
+    return flag.lower() in ('1', 'true', 'yes') or req.args.get('mode') == 'async'
+
+def run_analysis_job(params: dict, image_data: bytes) -> dict:
+    """
+    Job queue handler: the same work as a synchronous /analyze, run on a job worker thread.
+    Jobs run in the batch lane, waiting for a slot rather than being rejected.
+    """
+    with admission.admit(lane='batch', wait=job_queue.lease_seconds / 2):
+        gemini_response = run_async(ai_response(image_data, params.get('prompt', ''), params.get('plant_type', ''), params.get('plant_species', '')))
+    error_detail = _analysis_error(gemini_response)
+    if error_detail is not None:
+        raise RuntimeError(f"AI Analysis Failed: {error_detail}")
+    report_id = report_store.put_deferred({'kind': 'single', 'analysis': gemini_response, 'generated_at': time.time()})
+    history_id = history_store.record(gemini_response, image_data, params.get('prompt', ''), params.get('plant_type', ''), report_id)
+    return {'analysis': gemini_response, 'report_id': report_id, 'pdf_timestamp': report_id, 'history_id': history_id}
+
+# durable queue for async /analyze requests; workers run in this process
+job_queue = JobQueue(run_analysis_job)
+job_queue.start()
+
 @app.route('/analyze', methods=['POST', 'OPTIONS'])
 def analyze_plant():
     if request.method == 'OPTIONS':
@@ -132,82 +309,303 @@ def analyze_plant():
         if 'image' not in request.files:
             return {'error': 'No image file provided'}, 400
         
+        # turn the request away before any Gemini work if the client or the service is over its limits;
+        # queued jobs are charged to the client now but take their slot when a worker runs them
+        job_mode = _wants_job(request)
+        _admit('interactive', slots=0 if job_mode else 1)
+
         image_file_storage = request.files['image']
-        image_data = image_file_storage.read() # Read file bytes once
+        with STAGE_LATENCY.time(stage="upload_read"):
+            image_data = read_upload(image_file_storage) # one buffer over the upload, shared by the whole pipeline
 
         plant_type = request.form.get('plant_type', '')
         plant_species = request.form.get('plant_species', '')
         prompt = request.form.get('prompt', '')
         
-        print(f"Received image: {image_file_storage.filename} ({len(image_data)} bytes)")
-        print(f"Received plant type: {plant_type}")
-        print(f"Received plant species: {plant_species}")
-        print(f"Received prompt: {prompt}")
+        log.debug("received analyze request", extra={
+            "upload_filename": image_file_storage.filename, "image_bytes": len(image_data),
+            "plant_type": plant_type, "plant_species": plant_species, "prompt": prompt
+        })
+
+        # queue the analysis and return right away when the client asked for job mode
+        if job_mode:
+            params = {'prompt': prompt, 'plant_type': plant_type, 'plant_species': plant_species}
+            try:
+                job_id = job_queue.submit(image_data, params, webhook_url=request.form.get('webhook_url') or None)
+            except QueueFullError as e:
+                response = jsonify({'error': str(e)})
+                response.headers['Retry-After'] = str(int(e.retry_after + 0.5))
+                return response, 429
+            except InvalidWebhookError as e:
+                return {'error': str(e)}, 400
+            return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/jobs/{job_id}'}), 202
 
         # Get Gemini response
-        gemini_response = asyncio.run(ai_response(image_data, prompt, plant_type, plant_species))
+        gemini_response = run_async(ai_response(image_data, prompt, plant_type, plant_species))
         
         # Check for errors
-        if not isinstance(gemini_response, dict) or gemini_response.get('disease_detected') == "Service Error" or "Error" in str(gemini_response.get('recommendations', '')): 
-            error_detail = "Unknown service error."
-            if isinstance(gemini_response, dict):
-                if isinstance(gemini_response.get('recommendations'), list) and gemini_response['recommendations']:
-                    error_detail = str(gemini_response['recommendations'][0])
-                elif gemini_response.get('disease_detected') == "Service Error" and not error_detail: # if recommendations didn't provide more detail
-                     error_detail = "AI service reported an error."
-                elif 'disease_detected' in gemini_response:
-                     error_detail = str(gemini_response['disease_detected'])
-
-            print(f"Error from ai_response: {gemini_response}")
+        error_detail = _analysis_error(gemini_response)
+        if error_detail is not None:
+            log.warning("error from ai_response", extra={"response": gemini_response})
             return {'error': f"AI Analysis Failed: {error_detail}"}, 500
                 
-        # Generate PDF
-        pdf_buffer = generate_pdf_report(gemini_response)
-        
-        # Create unique identifier for this analysis
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        
-        # Store PDF buffer in memory (you might want to use a proper caching solution in production)
-        if not hasattr(app, 'pdf_buffers'):
-            app.pdf_buffers = {}
-        app.pdf_buffers[timestamp] = pdf_buffer
+        # Store the report under a unique ID; the PDF is rendered when it's first downloaded
+        report_id = report_store.put_deferred({'kind': 'single', 'analysis': gemini_response, 'generated_at': time.time()})
 
-        # Return analysis results and PDF URL
+        # Save it to the history for the plant library; the write happens in the background
+        history_id = history_store.record(gemini_response, image_data, prompt, plant_type, report_id)
+
+        # Return analysis results and PDF ID ('pdf_timestamp' is kept for existing clients)
         return jsonify({
             'analysis': gemini_response,
-            'pdf_timestamp': timestamp
+            'report_id': report_id,
+            'pdf_timestamp': report_id,
+            'history_id': history_id
         })
             
+    except (RequestEntityTooLarge, AdmissionRejected):
+        raise
+    except ImageQualityError as e:
+        # tell the user what to fix rather than returning a diagnosis of an unusable photo
+        return jsonify({'error': str(e), 'issues': e.issues}), 422
     except Exception as e:
-        print(f"Error occurred: {str(e)}")
+        log.exception("error handling analyze request")
         return {'error': str(e)}, 500
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # liveness: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # readiness: warmed up and not shutting down
+    status = lifecycle.status()
+    status['upstreams'] = {name: stats['state'] for name, stats in upstream_stats().items()}
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(gemini2_vision_model.cache.stats())
+
+@app.route('/report-stats', methods=['GET'])
+def report_stats():
+    return jsonify(report_store.stats())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    return jsonify(job)
+
+@app.route('/job-stats', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.stats())
+
+@app.route('/history', methods=['GET'])
+def history():
+    """
+    One page of past diagnoses, newest first by default. Filters: species, disease, severity,
+    plant_health, q (species/disease prefix), since/until (epoch seconds or ISO 8601).
+    Pass `next_cursor` from the response as `cursor` to get the next page.
+    """
+    try:
+        page = history_store.query(
+            species=request.args.get('species'),
+            disease=request.args.get('disease'),
+            severity=request.args.get('severity'),
+            plant_health=request.args.get('plant_health'),
+            q=request.args.get('q'),
+            since=parse_time(request.args.get('since')),
+            until=parse_time(request.args.get('until')),
+            sort=request.args.get('sort', 'date'),
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return jsonify(page)
+
+@app.route('/history/<history_id>', methods=['GET'])
+def history_entry(history_id):
+    entry = history_store.get(history_id)
+    if entry is None:
+        return {'error': 'Diagnosis not found'}, 404
+    return jsonify(entry)
+
+@app.route('/history/images/<image_sha256>', methods=['GET'])
+def history_image(image_sha256):
+    path = history_store.image_path(image_sha256)
+    if path is None:
+        return {'error': 'Image not found'}, 404
+    # content-addressed, so the bytes behind a URL never change
+    response = send_file(path, mimetype='image/jpeg', max_age=365 * 24 * 60 * 60)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/history-stats', methods=['GET'])
+def history_stats():
+    return jsonify(history_store.stats())
+
+@app.route('/admission-stats', methods=['GET'])
+def admission_stats():
+    return jsonify(admission.stats())
+
+@app.route('/upstream-stats', methods=['GET'])
+def upstream_stats_route():
+    return jsonify(upstream_stats())
+
+@app.route('/analyze/batch', methods=['POST', 'OPTIONS'])
+def analyze_batch():
+    """
+    Analyze many images in one request and stream one NDJSON line per image as each finishes.
+
+    Images come from repeated `images` file fields and/or a zip `archive`. The plant_type,
+    plant_species and prompt form fields apply to every image; a `metadata` field holding
+    a JSON list (by upload order) or object (by filename) overrides them per image.
+    """
+    if request.method == 'OPTIONS':
+        response = make_response(('', 200))
+        response.headers.add('Access-Control-Allow-Origin', '*') # Be more specific in production
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response
+
+    try:
+        request.max_content_length = BATCH_MAX_UPLOAD_BYTES # must be set before the form is parsed
+        max_image_bytes = app.config['MAX_CONTENT_LENGTH'] # each image is held to the single-upload limit
+        images = [(f.filename, read_upload(f)) for f in request.files.getlist('images')]
+        for filename, image_data in images:
+            if len(image_data) > max_image_bytes:
+                return {'error': f'Image too large: {filename} (max {max_image_bytes} bytes)'}, 413
+
+        if 'archive' in request.files:
+            with zipfile.ZipFile(request.files['archive']) as archive:
+                entries = [info for info in archive.infolist()
+                           if not info.is_dir() and info.filename.lower().endswith(BATCH_IMAGE_EXTENSIONS)]
+                if len(images) + len(entries) > BATCH_MAX_IMAGES:
+                    return {'error': f'Too many images: {len(images) + len(entries)} (max {BATCH_MAX_IMAGES})'}, 413
+                # check the declared sizes before decompressing anything; reads stop at the declared size
+                for info in entries:
+                    if info.file_size > max_image_bytes:
+                        return {'error': f'Image too large: {info.filename} (max {max_image_bytes} bytes)'}, 413
+                uncompressed_bytes = sum(info.file_size for info in entries)
+                if uncompressed_bytes > BATCH_MAX_UPLOAD_BYTES:
+                    return {'error': f'Archive too large when uncompressed: {uncompressed_bytes} bytes (max {BATCH_MAX_UPLOAD_BYTES})'}, 413
+                images.extend((info.filename, archive.read(info)) for info in entries)
+
+        if not images:
+            return {'error': 'No images provided'}, 400
+        if len(images) > BATCH_MAX_IMAGES:
+            return {'error': f'Too many images: {len(images)} (max {BATCH_MAX_IMAGES})'}, 413
+
+        shared_metadata = {
+            'plant_type': request.form.get('plant_type', ''),
+            'plant_species': request.form.get('plant_species', ''),
+            'prompt': request.form.get('prompt', '')
+        }
+        per_image_metadata = json.loads(request.form.get('metadata') or 'null')
+        overrides = per_image_metadata if isinstance(per_image_metadata, list) else (
+            per_image_metadata.values() if isinstance(per_image_metadata, dict) else None)
+        if per_image_metadata is not None and (overrides is None or not all(entry is None or isinstance(entry, dict) for entry in overrides)):
+            return {'error': 'Invalid batch request: metadata must be a JSON list or object of objects'}, 400
+
+        items = []
+        for index, (filename, image_data) in enumerate(images):
+            metadata = dict(shared_metadata)
+            if isinstance(per_image_metadata, list) and index < len(per_image_metadata):
+                metadata.update(per_image_metadata[index] or {})
+            elif isinstance(per_image_metadata, dict):
+                metadata.update(per_image_metadata.get(filename) or {})
+            items.append((filename, image_data, metadata))
+
+        concurrency = max(1, min(int(request.form.get('concurrency', BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY))
+        combined_pdf = request.form.get('combined_pdf', '').lower() in ('1', 'true', 'yes')
+    except (zipfile.BadZipFile, json.JSONDecodeError, ValueError) as e:
+        return {'error': f'Invalid batch request: {e}'}, 400
+
+    # a batch is one request against the client's rate limit, and holds up to `concurrency` batch-lane slots
+    concurrency = min(concurrency, _admit('batch', slots=concurrency).slots or concurrency)
+
+    log.info("received batch", extra={"images": len(items), "concurrency": concurrency})
+
+    async def analyze_one(index, item):
+        filename, image_data, metadata = item
+        return await ai_response(image_data, metadata.get('prompt', ''), metadata.get('plant_type', ''), metadata.get('plant_species', ''))
+
+    def generate():
+        # started with the stream, so the fan-out never outlives the response (or its admission slots)
+        results = queue.Queue()
+        fan_out_future = submit_async(fan_out(items, analyze_one, concurrency, batch_rate_limiter, results))
+        try:
+            yield from _batch_lines(results)
+        finally:
+            # stop the remaining Gemini calls if the client went away mid-stream
+            fan_out_future.cancel()
+
+    def _batch_lines(results):
+        succeeded = []
+        failed = 0
+        while True:
+            completed = results.get()
+            if completed is BATCH_DONE:
+                break
+            index, result = completed
+            filename = items[index][0]
+
+            if isinstance(result, ImageQualityError):
+                failed += 1
+                yield json.dumps({'type': 'error', 'index': index, 'filename': filename, 'error': str(result), 'issues': result.issues}) + "\n"
+            elif isinstance(result, Exception) or result.get('disease_detected') in ERROR_DIAGNOSES:
+                failed += 1
+                error_detail = str(result) if isinstance(result, Exception) else str(result.get('recommendations', ''))
+                yield json.dumps({'type': 'error', 'index': index, 'filename': filename, 'error': f"AI Analysis Failed: {error_detail}"}) + "\n"
+            else:
+                succeeded.append((index, filename, result))
+                _, image_data, metadata = items[index]
+                history_id = history_store.record(result, image_data, metadata.get('prompt', ''), metadata.get('plant_type', ''))
+                yield json.dumps({'type': 'result', 'index': index, 'filename': filename, 'analysis': result, 'history_id': history_id}) + "\n"
+
+        summary = {'type': 'summary', 'total': len(items), 'succeeded': len(succeeded), 'failed': failed}
+        if combined_pdf and succeeded:
+            succeeded.sort(key=lambda entry: entry[0]) # keep upload order in the report
+            summary['report_id'] = summary['pdf_timestamp'] = report_store.put_deferred({
+                'kind': 'batch',
+                'results': [(filename, result) for _, filename, result in succeeded],
+                'generated_at': time.time()
+            })
+        yield json.dumps(summary) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # New endpoint for PDF download
-@app.route('/download-pdf/<timestamp>', methods=['GET'])
-def download_pdf(timestamp):
+@app.route('/download-pdf/<report_id>', methods=['GET'])
+def download_pdf(report_id):
     try:
-        if not hasattr(app, 'pdf_buffers') or timestamp not in app.pdf_buffers:
+        # reports stay downloadable until they expire or are evicted from the store
+        pdf_file = report_store.open(report_id)
+        if pdf_file is None:
             return {'error': 'PDF not found'}, 404
-            
-        pdf_buffer = app.pdf_buffers[timestamp]
-        
-        # Clean up the stored buffer after sending
-        del app.pdf_buffers[timestamp]
         
         return send_file(
-            pdf_buffer,
+            pdf_file,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'plant_diagnosis_report_{timestamp}.pdf'
+            download_name=f'plant_diagnosis_report_{report_id}.pdf'
         )
     except Exception as e:
-        print(f"Error downloading PDF: {str(e)}")
+        log.exception("error downloading PDF")
         return {'error': str(e)}, 500
 
 if __name__ == '__main__':
     actual_port = int(port)
-    print(f"Starting microservice on http://localhost:{actual_port}")
-    # Consider using threaded=True for development if asyncio.run is blocking other requests
-    # For production with asyncio, an ASGI server like Uvicorn or Hypercorn is recommended
-    # e.g., uvicorn app:app --host 0.0.0.0 --port 5050 --reload
-    app.run(host='0.0.0.0', port=actual_port, debug=True) 
\ No newline at end of file
+    warm_up()
+    log.info(f"Starting microservice on http://localhost:{actual_port} (development server; use server.py in production)")
+    # Upstream calls run on a shared event loop (utils/async_runner.py), so request threads
+    # only wait on it and many in-flight diagnoses overlap their I/O
+    app.run(host='0.0.0.0', port=actual_port, debug=True, threaded=True) 
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Microbenchmark for the diagnosis history (utils/history_store.py): time to load one library page
+at growing history sizes, against the old lowdb approach of reading the whole JSON array and
+filtering and sorting it on the client.
+
+Pages are timed at the start of the history and deep into it (via a keyset cursor), with and
+without filters. The history store times should stay flat as the history grows.
+
+Usage: python benchmarks/bench_history.py [--sizes 1000,10000,100000] [--runs 50]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.history_store import HEALTH_RANK, HistoryStore, _encode_cursor, _key
+
+SPECIES = ["Solanum lycopersicum", "Rosa", "Malus domestica", "Pyrus communis", "Ocimum basilicum", "Capsicum annuum"]
+DISEASES = ["Early blight", "Powdery mildew", "Black spot", "Pear leaf spot", "Downy mildew", "Healthy"]
+SEVERITIES = ["low", "medium", "high"]
+
+
+def fill(store: HistoryStore, size: int, seed: int) -> list:
+    """Insert `size` synthetic diagnoses in one transaction and return them as frontend Plant dicts"""
+    rng = random.Random(seed)
+    rows, plants = [], []
+    started = time.time() - size * 60
+    for index in range(size):
+        species, disease = rng.choice(SPECIES), rng.choice(DISEASES)
+        severity, health = rng.choice(SEVERITIES), rng.choice(list(HEALTH_RANK))
+        confidence = rng.randint(40, 99)
+        analysis = {"plant_species": species, "disease_detected": disease, "confidence": f"{confidence}%",
+                    "confidence_value": float(confidence), "severity": severity, "plant_health": health,
+                    "recommendations": ["Remove affected leaves.", "Apply a fungicide."], "extra_info": ""}
+        history_id = f"{index:032x}"
+        created_at = started + index * 60
+        rows.append((history_id, created_at, species, _key(species), disease, _key(disease), severity, health,
+                     HEALTH_RANK[health], float(confidence), "0" * 64, None, "", "", json.dumps(analysis)))
+        plants.append({"id": history_id, "species": species, "image": "data:image/jpeg;base64," + "A" * 2000,
+                       "diagnosis": disease, "treatments": analysis["recommendations"], "confidence": f"{confidence}%",
+                       "severity": severity, "plant_health": health, "date": created_at, "notes": ""})
+    db = store._db()
+    with db:
+        db.executemany(f"INSERT INTO diagnoses ({store._COLUMNS}) VALUES ({', '.join('?' * 15)})", rows)
+    return plants
+
+
+def legacy_page(plants_json: str, severity: str = None, limit: int = 24) -> list:
+    """GET /api/plants returned the whole array, which the library then filtered and sorted"""
+    plants = json.loads(plants_json)
+    if severity:
+        plants = [plant for plant in plants if plant["severity"] == severity]
+    plants.sort(key=lambda plant: plant["date"], reverse=True)
+    return plants[:limit]
+
+
+def deep_cursor(store: HistoryStore, fraction: float) -> str:
+    """Cursor positioned `fraction` of the way into the newest-first history"""
+    db = store._db()
+    total = db.execute("SELECT COUNT(*) FROM diagnoses").fetchone()[0]
+    row = db.execute("SELECT created_at, id FROM diagnoses ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+                     (int(total * fraction),)).fetchone()
+    return _encode_cursor(list(row))
+
+
+def time_ms(func, runs: int) -> float:
+    started = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - started) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'history':>8}  {'first page':>10}  {'90% deep':>9}  {'severity':>9}  {'q prefix':>9}  {'by health':>9}  {'legacy':>9}  {'legacy+filter':>13}   (ms per page)")
+    for size in (int(size) for size in args.sizes.split(",")):
+        directory = tempfile.mkdtemp(prefix="bench_history_")
+        store = HistoryStore(db_path=os.path.join(directory, "history.db"), blob_dir=os.path.join(directory, "images"))
+        plants_json = json.dumps(fill(store, size, args.seed))
+        cursor = deep_cursor(store, 0.9)
+
+        timings = [
+            time_ms(lambda: store.query(), args.runs),
+            time_ms(lambda: store.query(cursor=cursor), args.runs),
+            time_ms(lambda: store.query(severity="high", cursor=cursor), args.runs),
+            time_ms(lambda: store.query(q="pow"), args.runs),
+            time_ms(lambda: store.query(sort="health"), args.runs),
+            time_ms(lambda: legacy_page(plants_json), max(1, args.runs // 10)),
+            time_ms(lambda: legacy_page(plants_json, severity="high"), max(1, args.runs // 10)),
+        ]
+        print(f"{size:>8}  " + "  ".join(f"{value:>{width}.2f}" for value, width in zip(timings, (10, 9, 9, 9, 9, 9, 13))))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Microbenchmark for PDF report rendering: the original per-request generate_pdf_report
+(truncating at 70/80 characters) against the template-based renderer in utils/pdf_report.py.
+
+Usage: python benchmarks/bench_pdf_report.py [--runs 500]
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pdf_report import generate_pdf_report
+
+SAMPLE_ANALYSIS = {
+    "plant_species": "Solanum lycopersicum",
+    "disease_detected": "Early blight (Alternaria solani)",
+    "confidence": "87%",
+    "severity": "medium",
+    "recommendations": [
+        "Remove and destroy the lower leaves showing concentric target-like lesions to slow the spread of spores.",
+        "Apply a copper-based or chlorothalonil fungicide every 7-10 days, following the label instructions carefully.",
+        "Water at the base of the plant in the morning so the foliage dries quickly.",
+        "Mulch around the base to stop soil-borne spores from splashing onto the leaves.",
+    ],
+    "plant_health": "fair",
+    "extra_info": "Early blight thrives in warm, humid weather and overwinters on plant debris, so rotate crops and clear debris at the end of the season.",
+}
+
+
+def legacy_generate_pdf_report(analysis_results: dict) -> BytesIO:
+    """The generate_pdf_report that used to run inside every /analyze request"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(50, 750, "Plant Disease Diagnostic Report")
+    c.setFont("Helvetica", 10)
+    c.drawString(50, 730, f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    c.setFont("Helvetica", 12)
+    y_position = 700
+    for key, value in analysis_results.items():
+        key_str = str(key).replace("_", " ").title()
+        if isinstance(value, list):
+            c.drawString(50, y_position, f"{key_str}:")
+            y_position -= 15
+            for item in value:
+                item_str = str(item)
+                if len(item_str) > 80:
+                    item_str = item_str[:77] + "..."
+                c.drawString(70, y_position, f"• {item_str}")
+                y_position -= 15
+                if y_position < 50:
+                    c.showPage()
+                    c.setFont("Helvetica", 12)
+                    y_position = 750
+        else:
+            value_str = str(value)
+            if len(value_str) > 70:
+                value_str = value_str[:67] + "..."
+            c.drawString(50, y_position, f"{key_str}: {value_str}")
+            y_position -= 20
+        if y_position < 50:
+            c.showPage()
+            c.setFont("Helvetica", 12)
+            y_position = 750
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def measure(name: str, func, runs: int):
+    func(SAMPLE_ANALYSIS) # warm up imports and font metrics
+    start = time.perf_counter()
+    for _ in range(runs):
+        size = len(func(SAMPLE_ANALYSIS).getvalue())
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {runs / elapsed:8.1f} reports/s  {elapsed / runs * 1000:6.2f} ms/report  {size} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=500)
+    args = parser.parse_args()
+
+    # utils.pdf_report turns off ASCII85 stream armor process-wide; restore the default for the baseline
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 1
+    measure("before", legacy_generate_pdf_report, args.runs)
+    rl_config.useA85 = use_a85
+    measure("after", generate_pdf_report, args.runs)
+    print("\nNote: /analyze no longer renders at all; the 'after' cost is paid once, on the first /download-pdf.")
+
+
+if __name__ == "__main__":
+    main()
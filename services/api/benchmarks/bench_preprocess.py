@@ -0,0 +1,81 @@
+"""
+Compare bytes-to-model and latency of the in-process Pillow preprocessing against the remote
+img_compress service (skipped if IMG_COMPRESS_URL isn't reachable).
+
+Usage: python benchmarks/bench_preprocess.py [--runs 20] [--width 4032] [--height 3024]
+"""
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_preprocess import ImagePreprocessor
+
+
+def make_photo(width: int, height: int) -> bytes:
+    """Create a phone-sized JPEG with enough noise that it doesn't compress trivially"""
+    img = Image.effect_noise((width, height), 64).convert('RGB')
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=92)
+    return output.getvalue()
+
+
+def run_local(image_data: bytes, preprocessor: ImagePreprocessor) -> bytes:
+    image_bytes, _ = preprocessor.process(image_data)
+    return image_bytes
+
+
+def run_remote(image_data: bytes, session: requests.Session, url: str) -> bytes:
+    response = session.post(f"{url}/compress", files={"file": ("image.jpg", image_data, "image/jpeg")}, timeout=30)
+    response.raise_for_status()
+    compressed_base64 = response.json()['compressedFile']
+    if compressed_base64.startswith("data:image"):
+        compressed_base64 = compressed_base64.split(",")[1]
+    return base64.b64decode(compressed_base64)
+
+
+def measure(name: str, func, runs: int, input_size: int):
+    timings = []
+    output_size = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        output_size = len(func())
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{name:<8} bytes-to-model: {output_size:>9} ({output_size / input_size:6.1%} of input)  "
+          f"p50: {statistics.median(timings):7.1f} ms  p95: {timings[min(len(timings) - 1, int(len(timings) * 0.95))]:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    args = parser.parse_args()
+
+    image_data = make_photo(args.width, args.height)
+    print(f"input: {args.width}x{args.height} JPEG, {len(image_data)} bytes, {args.runs} runs\n")
+
+    preprocessor = ImagePreprocessor()
+    measure("local", lambda: run_local(image_data, preprocessor), args.runs, len(image_data))
+
+    url = os.getenv('IMG_COMPRESS_URL', 'http://localhost:3000')
+    session = requests.Session()
+    try:
+        run_remote(image_data, session, url)
+    except requests.RequestException as e:
+        print(f"remote   skipped ({url} unavailable: {e.__class__.__name__})")
+        return
+    measure("remote", lambda: run_remote(image_data, session, url), args.runs, len(image_data))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Accuracy and latency of the image quality gate (utils/image_quality.py) on a synthetic sample set.
+
+The set is generated from a seed: in-focus leaf photos (healthy, diseased and red-leaved) that should pass,
+and the same photos blurred, darkened, blown out or shrunk, plus scenes with no plant, that should
+be rejected by the matching check. The script prints how each category fared with the current
+thresholds (set through the usual QUALITY_* variables), the median scores per category to help
+tune them, and the time the gate takes per upload.
+
+Usage: python benchmarks/bench_quality_gate.py [--per-category 20] [--size 1600] [--seed 0] [--show-scores]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_quality import ImageQualityGate
+
+# category -> the check expected to reject it (None: should pass)
+CATEGORIES = {
+    "healthy": None,
+    "diseased": None,
+    "red_leaf": None,
+    "blurry": "blur",
+    "very_blurry": "blur",
+    "dark": "exposure",
+    "overexposed": "exposure",
+    "low_resolution": "resolution",
+    "no_plant": "plant",
+}
+
+
+def textured(rng: random.Random, size: tuple, color: tuple, grain: int) -> Image.Image:
+    """A flat colour with film-grain-like noise, so surfaces have the fine detail real photos do"""
+    noise = Image.effect_noise(size, grain).convert("L")
+    base = Image.new("RGB", size, color)
+    return Image.composite(base, Image.new("RGB", size, tuple(max(0, c - 40) for c in color)), noise)
+
+
+def leaf_photo(rng: random.Random, size: tuple, diseased: bool, red: bool = False) -> Image.Image:
+    width, height = size
+    img = textured(rng, size, (rng.randint(90, 130), rng.randint(70, 95), rng.randint(45, 65)), 60) # soil
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(3, 6)):
+        cx, cy = rng.randint(0, width), rng.randint(0, height)
+        rx, ry = rng.randint(width // 8, width // 3), rng.randint(height // 10, height // 4)
+        if red: # red-leaf maple through purple basil
+            leaf = (rng.randint(200, 240), rng.randint(60, 100), rng.randint(110, 160))
+            edge, midrib, vein = (90, 20, 45), (120, 30, 60), (140, 40, 75)
+        else:
+            leaf = (rng.randint(40, 110), rng.randint(120, 190), rng.randint(30, 80))
+            edge, midrib, vein = (20, 70, 20), (150, 200, 120), (130, 180, 100)
+        draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=leaf, outline=edge, width=3)
+        draw.line((cx - rx, cy, cx + rx, cy), fill=midrib, width=4)
+        for step in range(1, 6):
+            x = cx - rx + step * 2 * rx // 6
+            draw.line((x, cy, x + rx // 5, cy - ry * 2 // 3), fill=vein, width=2)
+            draw.line((x, cy, x + rx // 5, cy + ry * 2 // 3), fill=vein, width=2)
+        if diseased:
+            for _ in range(rng.randint(8, 25)):
+                sx, sy = cx + rng.randint(-rx // 2, rx // 2), cy + rng.randint(-ry // 2, ry // 2)
+                radius = rng.randint(width // 200, width // 60)
+                spot = rng.choice([(120, 80, 30), (200, 180, 60), (60, 40, 20)])
+                draw.ellipse((sx - radius, sy - radius, sx + radius, sy + radius), fill=spot, outline=(200, 190, 80))
+    grain = Image.effect_noise(size, 25).convert("RGB")
+    return Image.blend(img, grain, 0.08)
+
+
+def no_plant_photo(rng: random.Random, size: tuple) -> Image.Image:
+    width, height = size
+    kind = rng.choice(["wall", "sky", "document"])
+    if kind == "wall":
+        return textured(rng, size, (rng.randint(150, 200),) * 3, 50)
+    if kind == "sky":
+        img = textured(rng, size, (90, 150, 220), 20)
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(2, 5)):
+            cx, cy, r = rng.randint(0, width), rng.randint(0, height // 2), rng.randint(width // 12, width // 5)
+            draw.ellipse((cx - r, cy - r // 2, cx + r, cy + r // 2), fill=(240, 240, 245))
+        return img
+    img = textured(rng, size, (225, 222, 215), 15)
+    draw = ImageDraw.Draw(img)
+    for line in range(40, height - 40, max(12, height // 40)):
+        draw.line((60, line, rng.randint(width // 2, width - 60), line), fill=(40, 40, 50), width=max(2, height // 300))
+    return img
+
+
+def make_sample(rng: random.Random, category: str, size: tuple) -> Image.Image:
+    if category == "no_plant":
+        return no_plant_photo(rng, size)
+    img = leaf_photo(rng, size, diseased=category == "diseased", red=category == "red_leaf")
+    if category == "blurry":
+        return img.filter(ImageFilter.GaussianBlur(size[0] / 160))
+    if category == "very_blurry":
+        return img.filter(ImageFilter.GaussianBlur(size[0] / 60))
+    if category == "dark":
+        return ImageEnhance.Brightness(img).enhance(rng.uniform(0.08, 0.2))
+    if category == "overexposed":
+        return ImageEnhance.Brightness(img).enhance(rng.uniform(3.5, 5.0))
+    if category == "low_resolution":
+        return img.resize((rng.randint(120, 200), rng.randint(90, 150)))
+    return img
+
+
+def encode(img: Image.Image) -> bytes:
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=88)
+    return output.getvalue()
+
+
+def run_accuracy(gate: ImageQualityGate, per_category: int, size: tuple, seed: int, show_scores: bool) -> int:
+    rng = random.Random(seed)
+    mistakes = 0
+    print(f"{'category':<16} {'expected':<11} {'correct':>8}  {'sharpness':>9} {'brightness':>10} {'plant':>6}  rejected by")
+    for category, expected in CATEGORIES.items():
+        correct, scores, rejected_by = 0, [], {}
+        for _ in range(per_category):
+            score = gate.score(encode(make_sample(rng, category, size)))
+            checks = [issue["check"] for issue in gate.issues(score)]
+            for check in checks:
+                rejected_by[check] = rejected_by.get(check, 0) + 1
+            correct += (not checks) if expected is None else expected in checks
+            scores.append(score)
+            if show_scores:
+                print(f"    {category:<14} {checks!s:<24} " + " ".join(f"{key}={value:.3g}" for key, value in score.items()))
+        mistakes += per_category - correct
+        median = lambda key: statistics.median(score[key] for score in scores)
+        print(f"{category:<16} {expected or 'pass':<11} {correct:>4}/{per_category:<3}  {median('sharpness'):>9.1f} "
+              f"{median('brightness'):>10.1f} {median('plant_ratio'):>6.3f}  {rejected_by or '-'}")
+    return mistakes
+
+
+def run_latency(gate: ImageQualityGate, runs: int, seed: int):
+    rng = random.Random(seed)
+    print(f"\ngate latency ({runs} runs each):")
+    for size in ((1600, 1200), (4032, 3024)):
+        image_data = encode(leaf_photo(rng, size, diseased=True))
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            try:
+                gate.check(image_data)
+            except ValueError:
+                pass
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"  {size[0]}x{size[1]} JPEG ({len(image_data) / 1e6:.1f} MB): "
+              f"p50 {statistics.median(timings):.1f} ms, p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--per-category", type=int, default=20)
+    parser.add_argument("--size", type=int, default=1600, help="width of generated photos (4:3)")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--show-scores", action="store_true", help="print the scores of every sample")
+    args = parser.parse_args()
+
+    gate = ImageQualityGate(enabled=True)
+    mistakes = run_accuracy(gate, args.per_category, (args.size, args.size * 3 // 4), args.seed, args.show_scores)
+    run_latency(gate, args.runs, args.seed)
+    sys.exit(1 if mistakes else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Measure peak Python heap growth (tracemalloc) while /analyze handles one large upload, against the
+stub Gemini client and, for the remote backend, the stub compression service (run in a child
+process so its own buffers aren't counted).
+
+Requests are built up front and fed straight to the WSGI app, so the client's copy of the body
+isn't counted. Pillow's decode buffers are allocated outside the Python heap and aren't counted
+either; with draft mode they're bounded by IMAGE_MAX_EDGE, not by the upload size.
+
+Usage: python benchmarks/bench_upload_memory.py [--runs 5] [--width 4032] [--height 3024] [--legacy]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import tracemalloc
+from io import BytesIO
+
+from flask import Request
+from werkzeug.test import EnvironBuilder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_preprocess import make_photo
+from benchmarks.stubs import StubCompressor, install_stub_genai
+
+
+def serve_compressor(urls):
+    urls.put(StubCompressor().start().url)
+    multiprocessing.Event().wait()
+
+
+def build_environ(image_data: bytes, prompt: str) -> dict:
+    builder = EnvironBuilder(path="/analyze", method="POST",
+                             data={"image": (BytesIO(image_data), "leaf.jpg", "image/jpeg"), "prompt": prompt})
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def run_once(app_module, environ: dict) -> int:
+    """Run one request through the app and return the peak heap growth in bytes"""
+    status = []
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    body = b"".join(app_module.app.wsgi_app(environ, lambda s, h, exc_info=None: status.append(s)))
+    _, peak = tracemalloc.get_traced_memory()
+    if not status[0].startswith("200"):
+        raise RuntimeError(f"/analyze failed: {status[0]} {body[:200]!r}")
+    return peak - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--legacy", action="store_true", help="read the upload into bytes with werkzeug's default spooling, as before")
+    args = parser.parse_args()
+
+    install_stub_genai()
+    urls = multiprocessing.Queue()
+    compressor = multiprocessing.Process(target=serve_compressor, args=(urls,), daemon=True)
+    compressor.start()
+    os.environ["IMG_COMPRESS_URL"] = urls.get(timeout=30)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("GEMINI_API_KEY", "offline-stub")
+    os.environ["DIAGNOSIS_CACHE_MAX_ENTRIES"] = "0" # every run should reach the preprocessing stage
+    os.environ.setdefault("JOB_QUEUE_DB", os.path.join(tempfile.mkdtemp(), "jobs.db"))
+    os.environ.setdefault("HISTORY_DIR", tempfile.mkdtemp())
+    os.environ.setdefault("QUALITY_GATE", "off")
+    os.environ.setdefault("ADMISSION_DB", os.path.join(tempfile.mkdtemp(), "admission.db"))
+    os.environ.setdefault("ADMISSION_MAX_CONCURRENT", "0")
+
+    import app as app_module # imported late so the stubs are in place first
+    if args.legacy:
+        app_module.app.request_class = Request
+        app_module.read_upload = lambda file_storage: file_storage.read()
+
+    image_data = make_photo(args.width, args.height)
+    print(f"upload: {args.width}x{args.height} JPEG, {len(image_data) / 1e6:.1f} MB, {args.runs} runs"
+          f"{' (legacy ingestion)' if args.legacy else ''}\n")
+
+    tracemalloc.start()
+    try:
+        for backend in ("local", "remote"):
+            app_module.gemini2_vision_model.preprocess_backend = backend
+            peaks = []
+            for run in range(args.runs):
+                environ = build_environ(image_data, f"run {run}")
+                peaks.append(run_once(app_module, environ))
+                del environ
+            peak = max(peaks)
+            print(f"{backend:<8} peak heap growth: {peak / 1e6:7.1f} MB  ({peak / len(image_data):4.1f}x the upload)")
+    finally:
+        tracemalloc.stop()
+        compressor.terminate()
+
+
+if __name__ == "__main__":
+    main()
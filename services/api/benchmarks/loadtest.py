@@ -0,0 +1,282 @@
+"""
+Offline load test: starts the Flask app against a stub Gemini client and a stub compression
+service, drives /analyze, /chat and /download-pdf at a fixed concurrency, and reports RPS,
+p50/p95/p99 latency, errors, and RSS growth over the run.
+
+Usage:
+    python benchmarks/loadtest.py --scenario analyze --requests 500 --concurrency 16 --gemini-latency 0.5
+    python benchmarks/loadtest.py --scenario mixed --duration 60 --gemini-error-rate 0.05 --json results.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import Faults, StubCompressor, install_stub_genai
+
+SCENARIOS = ("analyze", "chat", "chat-stream", "download", "mixed")
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (the app runs in-process)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # peak, on platforms without /proc
+
+
+def make_images(count: int, size: int) -> list:
+    images = []
+    for index in range(count):
+        img = Image.effect_noise((size, size), 32 + index % 64).convert("RGB")
+        output = BytesIO()
+        img.save(output, format="JPEG", quality=90)
+        images.append(output.getvalue())
+    return images
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.compressor = None
+        self.server = None
+        self.base_url = None
+        self.images = make_images(args.unique_images, args.image_size)
+        self.report_ids = []
+        self.report_ids_lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.results_lock = threading.Lock()
+        self.rss_samples = []
+
+    def start(self):
+        args = self.args
+        install_stub_genai(Faults(args.gemini_latency, args.gemini_latency * 0.2, args.gemini_error_rate))
+        self.compressor = StubCompressor(Faults(args.compress_latency, 0, args.compress_error_rate)).start()
+        os.environ["IMG_COMPRESS_URL"] = self.compressor.url
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ.setdefault("GEMINI_API_KEY", "offline-stub")
+        os.environ.setdefault("HISTORY_DIR", tempfile.mkdtemp(prefix="doctor_plant_history_")) # keep load-test diagnoses out of the real history
+        os.environ.setdefault("QUALITY_GATE", "off") # the generated noise images aren't plant photos
+        os.environ.setdefault("ADMISSION_DB", os.path.join(tempfile.mkdtemp(prefix="doctor_plant_admission_"), "admission.db"))
+        os.environ.setdefault("ADMISSION_MAX_CONCURRENT", "0") # measure the service, not the admission cap
+
+        import app as app_module # imported late so the stubs are in place first
+        self.app_module = app_module
+        self.server = make_server("127.0.0.1", 0, app_module.app, threaded=True, request_handler=QuietRequestHandler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, name="app-server", daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+        if self.compressor is not None:
+            self.compressor.stop()
+
+    def record(self, kind: str, started: float, ok: bool, detail: str = ""):
+        elapsed = time.perf_counter() - started
+        with self.results_lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+            if not ok:
+                self.errors.setdefault(kind, {}).setdefault(detail, 0)
+                self.errors[kind][detail] += 1
+
+    def do_analyze(self, session: requests.Session, index: int):
+        image = self.images[index % len(self.images)]
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{self.base_url}/analyze", files={"image": ("leaf.jpg", image, "image/jpeg")},
+                                    data={"prompt": "yellow spots on leaves", "plant_type": "vegetable"}, timeout=120)
+            ok = response.status_code == 200
+            if ok:
+                with self.report_ids_lock:
+                    self.report_ids.append(response.json()["report_id"])
+            self.record("analyze", started, ok, str(response.status_code))
+        except requests.RequestException as e:
+            self.record("analyze", started, False, e.__class__.__name__)
+
+    def do_chat(self, session: requests.Session, index: int, stream: bool = False):
+        kind = "chat-stream" if stream else "chat"
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{self.base_url}/chat", json={"message": f"How often should I water? ({index})",
+                                    "session_id": f"loadtest-{index % 50}", "stream": stream}, timeout=120)
+            ok = response.status_code == 200 and ("event: error" not in response.text if stream else "Gemini Chat Error" not in response.text)
+            self.record(kind, started, ok, str(response.status_code) if response.status_code != 200 else "upstream error")
+        except requests.RequestException as e:
+            self.record(kind, started, False, e.__class__.__name__)
+
+    def do_download(self, session: requests.Session, index: int):
+        with self.report_ids_lock:
+            report_id = random.choice(self.report_ids) if self.report_ids else None
+        if report_id is None:
+            return self.do_analyze(session, index)
+        started = time.perf_counter()
+        try:
+            response = session.get(f"{self.base_url}/download-pdf/{report_id}", timeout=120)
+            self.record("download", started, response.status_code == 200, str(response.status_code))
+        except requests.RequestException as e:
+            self.record("download", started, False, e.__class__.__name__)
+
+    def run_one(self, session: requests.Session, index: int):
+        scenario = self.args.scenario
+        if scenario == "mixed":
+            scenario = random.choices(("analyze", "chat", "download"), weights=(5, 3, 2))[0]
+        if scenario == "analyze":
+            self.do_analyze(session, index)
+        elif scenario == "chat":
+            self.do_chat(session, index)
+        elif scenario == "chat-stream":
+            self.do_chat(session, index, stream=True)
+        elif scenario == "download":
+            self.do_download(session, index)
+
+    def run(self) -> dict:
+        args = self.args
+        if args.scenario == "download":
+            # seed some reports to download
+            seed_session = requests.Session()
+            for index in range(min(20, args.unique_images)):
+                self.do_analyze(seed_session, index)
+            self.latencies.clear()
+            self.errors.clear()
+
+        counter = itertools.count()
+        deadline = time.monotonic() + args.duration if args.duration else None
+        stop_sampling = threading.Event()
+
+        def sample_rss():
+            started = time.monotonic()
+            while not stop_sampling.is_set():
+                self.rss_samples.append((time.monotonic() - started, rss_bytes()))
+                stop_sampling.wait(args.sample_interval)
+
+        def worker():
+            session = requests.Session()
+            while True:
+                index = next(counter)
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                if deadline is None and index >= args.requests:
+                    return
+                self.run_one(session, index)
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(worker)
+        elapsed = time.perf_counter() - started
+        stop_sampling.set()
+        sampler.join()
+        self.rss_samples.append((self.rss_samples[-1][0] if self.rss_samples else 0.0, rss_bytes()))
+        return self.summarize(elapsed)
+
+    def summarize(self, elapsed: float) -> dict:
+        def percentile(values: list, fraction: float) -> float:
+            return values[min(len(values) - 1, int(len(values) * fraction))]
+
+        endpoints = {}
+        for kind, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[kind] = {
+                "requests": len(values),
+                "errors": sum(self.errors.get(kind, {}).values()),
+                "error_detail": self.errors.get(kind, {}),
+                "rps": len(values) / elapsed,
+                "p50_ms": statistics.median(values) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+
+        rss_start = self.rss_samples[0][1] if self.rss_samples else 0
+        rss_end = self.rss_samples[-1][1] if self.rss_samples else 0
+        return {
+            "scenario": self.args.scenario,
+            "concurrency": self.args.concurrency,
+            "elapsed_s": elapsed,
+            "total_rps": sum(len(values) for values in self.latencies.values()) / elapsed,
+            "endpoints": endpoints,
+            "rss_start_mb": rss_start / 1e6,
+            "rss_end_mb": rss_end / 1e6,
+            "rss_growth_mb": (rss_end - rss_start) / 1e6,
+            "rss_samples": [(round(t, 2), round(rss / 1e6, 2)) for t, rss in self.rss_samples],
+            "report_store": self.app_module.report_store.stats(),
+            "diagnosis_cache": self.app_module.gemini2_vision_model.cache.stats(),
+        }
+
+
+def print_summary(summary: dict):
+    print(f"\nscenario={summary['scenario']} concurrency={summary['concurrency']} "
+          f"elapsed={summary['elapsed_s']:.1f}s total={summary['total_rps']:.1f} req/s\n")
+    print(f"{'endpoint':<12} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, stats in summary["endpoints"].items():
+        print(f"{kind:<12} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>8.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+        if stats["error_detail"]:
+            print(f"{'':<12} errors: {stats['error_detail']}")
+    print(f"\nRSS: {summary['rss_start_mb']:.1f} MB -> {summary['rss_end_mb']:.1f} MB "
+          f"({summary['rss_growth_mb']:+.1f} MB)")
+    print(f"report store: {summary['report_store']['entries']} entries, {summary['report_store']['bytes']} bytes, "
+          f"{summary['report_store']['evictions']} evictions")
+
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="analyze")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="run for this many seconds instead of a fixed count")
+    parser.add_argument("--unique-images", type=int, default=50, help="distinct images; fewer means more cache hits")
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--compress-latency", type=float, default=0.02)
+    parser.add_argument("--compress-error-rate", type=float, default=0.0)
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between RSS samples")
+    parser.add_argument("--json", help="also write the summary to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> dict:
+    args = parse_args(argv)
+    load_test = LoadTest(args)
+    load_test.start()
+    try:
+        summary = load_test.run()
+    finally:
+        load_test.stop()
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Local stand-ins for the Gemini client and the img_compress service, with injectable latency and
+error rates, so the app can be exercised offline without an API key.
+"""
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import httpx
+from google.genai import errors, types
+
+STUB_ANALYSIS = {
+    "plant_species": "Solanum lycopersicum",
+    "disease_detected": "Early blight",
+    "confidence": "87%",
+    "severity": "medium",
+    "recommendations": [
+        "Remove and destroy affected lower leaves.",
+        "Apply a copper-based fungicide every 7-10 days.",
+    ],
+    "plant_health": "fair",
+    "extra_info": "Early blight overwinters on plant debris; rotate crops.",
+}
+
+
+class Faults:
+    """Latency (seconds, mean with +/- jitter) and error rate (0-1) injected into a stub"""
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def _service_unavailable() -> errors.ServerError:
+    return errors.ServerError(503, {"error": {"code": 503, "message": "stub overloaded", "status": "UNAVAILABLE"}},
+                              httpx.Response(503))
+
+
+class _StubModels:
+    def __init__(self, faults: Faults, response_text: str = None):
+        self.faults = faults
+        self.response_text = response_text
+        self.calls = 0
+
+    async def generate_content(self, model: str, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(self.faults.delay())
+        if self.faults.should_fail():
+            raise _service_unavailable()
+        if self.response_text is not None:
+            return SimpleNamespace(text=self.response_text)
+        # like Gemini: bare JSON in JSON mode, a fenced block otherwise
+        if config is not None and getattr(config, "response_mime_type", None) == "application/json":
+            return SimpleNamespace(text=json.dumps(STUB_ANALYSIS))
+        return SimpleNamespace(text="```json\n" + json.dumps(STUB_ANALYSIS) + "\n```")
+
+    async def get(self, model: str, config=None):
+        return SimpleNamespace(name=model)
+
+
+class _StubChat:
+    def __init__(self, faults: Faults, history: list = None):
+        self.faults = faults
+        self.history = list(history or [])
+
+    def get_history(self, curated: bool = False) -> list:
+        return list(self.history)
+
+    def _reply(self, message: str) -> str:
+        return f"Stub answer about plant care for: {message}"
+
+    def _record(self, message: str, reply: str):
+        self.history.append(types.Content(role="user", parts=[types.Part(text=message)]))
+        self.history.append(types.Content(role="model", parts=[types.Part(text=reply)]))
+
+    async def send_message(self, message: str, config=None):
+        await asyncio.sleep(self.faults.delay())
+        if self.faults.should_fail():
+            raise _service_unavailable()
+        reply = self._reply(message)
+        self._record(message, reply)
+        return SimpleNamespace(text=reply)
+
+    async def send_message_stream(self, message: str, config=None):
+        reply = self._reply(message)
+        words = reply.split(" ")
+
+        async def chunks():
+            if self.faults.should_fail():
+                raise _service_unavailable()
+            for word in words:
+                await asyncio.sleep(self.faults.delay() / len(words))
+                yield SimpleNamespace(text=word + " ")
+            self._record(message, reply)
+
+        return chunks()
+
+
+class _StubChats:
+    def __init__(self, faults: Faults):
+        self.faults = faults
+
+    def create(self, model: str, config=None, history: list = None):
+        return _StubChat(self.faults, history)
+
+
+class StubGenaiClient:
+    """
+    Mimics the parts of google.genai.Client the service uses (client.aio.models / client.aio.chats)
+    """
+    def __init__(self, faults: Faults = None, response_text: str = None):
+        self.faults = faults or Faults()
+        self.models = _StubModels(self.faults, response_text)
+        self.aio = SimpleNamespace(models=self.models, chats=_StubChats(self.faults))
+
+
+class StubCompressor:
+    """
+    Threaded HTTP server with the img_compress contract: POST /compress (multipart "file")
+    returns {"compressedFile": "data:image/jpeg;base64,..."} echoing the upload
+    """
+    def __init__(self, faults: Faults = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or Faults()
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.requests += 1
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stub.faults.delay())
+                if self.path != "/compress" or stub.faults.should_fail():
+                    self.send_response(503 if self.path == "/compress" else 404)
+                    self.end_headers()
+                    return
+                # the multipart body is echoed back whole; the stub only needs to cost a realistic copy
+                payload = json.dumps({"compressedFile": "data:image/jpeg;base64," + base64.b64encode(_multipart_file(body)).decode()})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload.encode())
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-compressor", daemon=True)
+
+    def start(self) -> "StubCompressor":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _multipart_file(body: bytes) -> bytes:
+    """Pull the first part's content out of a multipart body"""
+    header_end = body.find(b"\r\n\r\n")
+    if header_end == -1:
+        return body
+    content = body[header_end + 4:]
+    boundary_start = content.rfind(b"\r\n--")
+    return content[:boundary_start] if boundary_start != -1 else content
+
+
+def install_stub_genai(faults: Faults = None, response_text: str = None) -> StubGenaiClient:
+    """
+    Make utils.upstream hand out a stub Gemini client; call this before importing app
+    """
+    from utils import upstream
+
+    client = StubGenaiClient(faults, response_text)
+    upstream._genai_client = client
+    return client
@@ -0,0 +1,53 @@
+"""
+One-off import of the plant library saved by the old lowdb store (db.json at the repository root,
+written by the Next.js /api/plants route) into the diagnosis history (utils/history_store.py),
+which the library now reads from.
+
+Plants keep their date, notes and image. Running the import again skips plants already imported.
+The history location comes from the usual HISTORY_* variables.
+
+Usage: python import_lowdb.py [path/to/db.json]
+"""
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from utils.history_store import HistoryStore
+from utils.logging_config import configure_logging, get_logger
+
+load_dotenv()
+configure_logging()
+log = get_logger("import_lowdb")
+
+DEFAULT_DB_JSON = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'db.json')
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_JSON
+    if not os.path.exists(path):
+        log.error("lowdb file not found", extra={"path": path})
+        sys.exit(1)
+    with open(path, encoding='utf-8') as f:
+        plants = json.load(f).get('plants', [])
+
+    store = HistoryStore()
+    imported = skipped = failed = 0
+    for plant in plants:
+        try:
+            if store.import_plant(plant):
+                imported += 1
+            else:
+                skipped += 1
+        except Exception as e:
+            failed += 1
+            log.warning("could not import plant", extra={"plant_id": plant.get('id'), "error": str(e)})
+    store.close()
+
+    log.info("lowdb import finished", extra={"path": path, "imported": imported, "skipped": skipped, "failed": failed})
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
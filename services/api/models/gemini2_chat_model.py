@@ -1,39 +1,101 @@
-from google import genai
 from google.genai import types
-import base64
-from io import BytesIO
-import json
 import os
-import requests
-import re
+
+from utils.chat_session_pool import ChatSessionPool
+from utils.upstream import get_genai_client, get_upstream
+from utils.metrics import UPSTREAM_IN_FLIGHT
+from utils.logging_config import get_logger
+
+log = get_logger("chat")
+
+SYSTEM_INSTRUCTION = "You are a helpful assistant that can answer questions reagrding plant diseases and health issues. You can also help with tasks related to plant care and maintenance. Ensure that you stay on the topic of plants and plant care."
 
 class Gemini2ChatModel:
     """
     Gemini 2 Chat model class that calls the Gemini 2 Chat model to engage in a conversation with the user.
+    Each conversation gets its own chat session from a bounded pool, and its history is trimmed
+    to a token budget so the cost of a message doesn't grow with the length of the conversation.
     """
     def __init__(self):
-        self.client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-        self.chat_session = self.client.chats.create(model='gemini-2.0-flash')
-        
-    def chat(self, message: str) -> dict:
+        self.client = get_genai_client()
+        self.gemini = get_upstream('gemini')
+        self.model = 'gemini-2.0-flash'
+        self.history_token_budget = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', 4000))
+        self.config = types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION)
+        self.sessions = ChatSessionPool(self._create_chat)
+
+    def _create_chat(self, history: list = None):
+        # histories loaded from the shared session store are plain dicts
+        history = [types.Content.model_validate(content) if isinstance(content, dict) else content for content in history or []]
+        return self.client.aio.chats.create(model=self.model, config=self.config, history=history)
+
+    async def chat(self, message: str, session_id: str) -> dict:
         """
         Engage in a conversation with the user using the Gemini 2 Chat model
         """
-        # encode and compress the image
         try:
-            response = self.chat_session.send_message(
-                message,
-                config=types.GenerateContentConfig(
-                    system_instruction="You are a helpful assistant that can answer questions reagrding plant diseases and health issues. You can also help with tasks related to plant care and maintenance. Ensure that you stay on the topic of plants and plant care."
-                )
-            )
+            chat_session, lock = await self.sessions.acquire(session_id)
+            async with lock:
+                chat_session = self._trim_history(session_id, chat_session)
+                with UPSTREAM_IN_FLIGHT.track_inprogress(upstream="gemini"):
+                    response = await self.gemini.call(chat_session.send_message, message)
+                await self.sessions.save(session_id, chat_session)
             return response.text
         except Exception as e:
-            print(f"Gemini Chat error: {e}")
+            log.error("Gemini Chat error", extra={"error": str(e), "session_id": session_id})
             return {"Gemini Chat Error": str(e)}
 
-    def close_chat(self):
+    async def chat_stream(self, message: str, session_id: str):
+        """
+        Same as chat, but yields the response text in chunks as the model generates it
+        """
+        chat_session, lock = await self.sessions.acquire(session_id)
+        async with lock:
+            chat_session = self._trim_history(session_id, chat_session)
+            # a partly streamed reply can't be replayed, so streams aren't retried, only circuit-broken
+            trial = self.gemini.breaker.before_call()
+            try:
+                async for chunk in await chat_session.send_message_stream(message):
+                    if chunk.text:
+                        yield chunk.text
+            except Exception as e:
+                self.gemini.record_error(e)
+                raise
+            except BaseException:
+                # the client went away (GeneratorExit) or the task was cancelled mid-stream
+                if trial:
+                    self.gemini.breaker.abandon_trial()
+                raise
+            self.gemini.breaker.record_success()
+            await self.sessions.save(session_id, chat_session)
+
+    def _trim_history(self, session_id: str, chat_session):
+        """
+        Drop the oldest turns until the history fits in the token budget, rebuilding the session if anything was dropped
+        """
+        history = chat_session.get_history()
+        if self._estimate_tokens(history) <= self.history_token_budget:
+            return chat_session
+
+        trimmed = list(history)
+        while trimmed and self._estimate_tokens(trimmed) > self.history_token_budget:
+            # remove a whole user/model turn so the history still starts with a user message
+            trimmed = trimmed[2:]
+        while trimmed and trimmed[0].role != 'user':
+            trimmed = trimmed[1:]
+
+        chat_session = self._create_chat(trimmed)
+        self.sessions.replace(session_id, chat_session)
+        return chat_session
+
+    @staticmethod
+    def _estimate_tokens(history: list) -> int:
+        # ~4 characters per token is close enough for budgeting
+        characters = sum(len(part.text or '') for content in history for part in (content.parts or []))
+        return characters // 4
+
+    async def close_chat(self, session_id: str = None):
         """
-        Close the chat session
+        Close one chat session, or all of them
         """
-        self.chat_session.close()
+        await self.sessions.close(session_id)
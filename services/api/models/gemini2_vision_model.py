@@ -1,95 +1,236 @@
-from google import genai
 from google.genai import types
 import base64
 from io import BytesIO
+import binascii
 import json
 import os
-import requests
-import re
+import httpx
+import asyncio
+import time
+
+from PIL import Image
+
+from utils.diagnosis_cache import DiagnosisCache
+from utils.image_preprocess import ImagePreprocessor
+from utils.image_quality import ImageQualityGate
+from utils.single_flight import SingleFlight
+from utils.uploads import BufferReader
+from utils.response_parser import ANALYSIS_RESPONSE_SCHEMA, ResponseParseError, parse_analysis
+from utils.upstream import get_genai_client, get_async_http_client, get_upstream
+from utils.metrics import STAGE_LATENCY, ANALYZE_ERRORS, UPSTREAM_IN_FLIGHT, VISION_TIER_LATENCY, VISION_DIAGNOSES, VISION_ESCALATIONS
+from utils.logging_config import get_logger
+
+log = get_logger("vision")
+
+# diagnoses with these labels are failures and must never be cached
+ERROR_DIAGNOSES = {"JSON Decode Error", "Analysis Error", "Gemini Vision Model Error", "Service Error"}
 
 class Gemini2VisionModel:
     """
-    Gemini 2 Vision model class that calls the compression service to compress the image,
-    encodes the image, and calls the Gemini 2 Vision model to analyze the image.
+    Gemini 2 Vision model class that preprocesses the image (in-process with Pillow, or through
+    the remote compression service), and calls the Gemini 2 Vision model to analyze the image.
+    Images go to the cheapest model in the ladder first and escalate to stronger ones only when
+    the diagnosis is low-confidence or severe.
     """
     def __init__(self):
-        self.client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+        self.client = get_genai_client()
+        self.gemini = get_upstream('gemini')
+        self.compressor = get_upstream('img_compress')
         self.compress_service_url = os.getenv('IMG_COMPRESS_URL', 'http://localhost:3000')
+        self.preprocess_backend = os.getenv('IMAGE_PREPROCESS_BACKEND', 'local').lower() # 'local' or 'remote'
+        self.preprocessor = ImagePreprocessor()
+        self.quality_gate = ImageQualityGate() # turns away blurry, dark, tiny or plant-less photos before any upstream call
+        self.cache = DiagnosisCache()
+        self.inflight = SingleFlight() # concurrent identical diagnoses share one upstream call
 
-    def encode_and_compress_image(self, image_file: BytesIO) -> str:
-        try:
-            image_file.seek(0)
+        # cheapest model first; a diagnosis moves up the ladder while it's unsure or severe
+        self.model_ladder = [model.strip() for model in os.getenv('VISION_MODEL_LADDER', 'gemini-2.0-flash-lite,gemini-2.0-flash').split(',') if model.strip()] or ['gemini-2.0-flash']
+        self.escalate_below_confidence = float(os.getenv('VISION_ESCALATE_CONFIDENCE', 70))
+        self.escalate_severities = {severity.strip().lower() for severity in os.getenv('VISION_ESCALATE_SEVERITIES', 'high').split(',') if severity.strip()}
 
-            files = {
-                "file": ("image.jpg", image_file, "image/jpeg")
-            }
+    async def warm_up(self, upstreams: bool = True):
+        """
+        Exercise the image pipeline once and, if `upstreams` is set, open pooled connections to
+        Gemini and the compression service, so the first real request doesn't pay for either
+        """
+        sample = BytesIO()
+        Image.new('RGB', (64, 64), color=(60, 140, 60)).save(sample, format='JPEG')
+        await asyncio.to_thread(self.preprocessor.process, sample.getvalue()) # loads Pillow's codecs
+        await asyncio.to_thread(self.quality_gate.score, sample.getvalue())
+        self.cache.make_key(sample.getvalue(), '', '', '')
 
-            # make a request to the compress service
-            response = requests.post(
-                f"{self.compress_service_url}/compress",
-                files=files,
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Error compressing image: {response.status_code}")
+        if not upstreams:
+            return
+        try:
+            if self.preprocess_backend == 'remote':
+                await get_async_http_client().get(self.compress_service_url) # any response opens the connection
+            # a metadata lookup: connects and checks the API key without generating anything
+            await self.client.aio.models.get(model=self.model_ladder[0])
+        except Exception as e:
+            log.warning("upstream warmup failed", extra={"error": str(e)})
 
-            # parse the response
-            data = response.json()
+    async def encode_and_compress_image(self, image_data) -> str:
+        try:
+            # make a request to the compress service over the pooled client, retrying transient failures
+            response = await self.compressor.call(self._post_to_compressor, image_data)
+
+            # parse the response straight from the raw body, skipping httpx's decoded-text copy
+            data = json.loads(response.content)
             compressed_base64 = data['compressedFile']
 
             # return the compressed image
             return compressed_base64
             
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             # log the request error
-            print(f"Error encoding image: {e}")
+            log.warning("compression request failed, sending uncompressed image", extra={"error": str(e)})
+            ANALYZE_ERRORS.inc(category="compression_fallback")
 
             # If fail: return image encoded without compressing
-            return self._encode_image(image_file)
+            return self._encode_image(image_data)
         except Exception as e:
             # log the error
-            print(f"Error encoding image: {e}")
-            return self._encode_image(image_file)
+            log.warning("compression failed, sending uncompressed image", extra={"error": str(e)})
+            ANALYZE_ERRORS.inc(category="compression_fallback")
+            return self._encode_image(image_data)
 
-    def _encode_image(self, image_file: BytesIO) -> str:
+    async def prepare_image(self, image_data) -> tuple:
+        """
+        Return (image_bytes, mime_type) ready to hand to the model, using the configured preprocessing backend
+        """
+        if self.preprocess_backend == 'remote':
+            with STAGE_LATENCY.time(stage="preprocess"), UPSTREAM_IN_FLIGHT.track_inprogress(upstream="img_compress"):
+                compressed_base64 = await self.encode_and_compress_image(image_data)
+            with STAGE_LATENCY.time(stage="base64_decode"):
+                return self._decode_data_url(compressed_base64)
+
+        try:
+            # Pillow work is CPU-bound, so keep it off the event loop
+            with STAGE_LATENCY.time(stage="preprocess"):
+                return await asyncio.to_thread(self.preprocessor.process, image_data)
+        except Exception as e:
+            # If fail: send the original bytes as-is
+            log.warning("preprocessing failed, sending original image", extra={"error": str(e)})
+            ANALYZE_ERRORS.inc(category="preprocess_fallback")
+            return bytes(image_data), "image/jpeg"
+
+    @staticmethod
+    def _decode_data_url(compressed_base64: str) -> tuple:
+        """
+        Turn the base64 (optionally data URL) string from the compression service back into raw bytes
+        """
+        start = 0
+        if compressed_base64.startswith("data:image"):
+            start = compressed_base64.index(",", 0, 256) + 1
+
+        if compressed_base64.startswith("data:image/png"):
+            mime_type = "image/png"
+        else:
+            mime_type = "image/jpeg"
+
+        # decode from a view past the data URL header, so the payload isn't sliced and re-encoded first
+        return binascii.a2b_base64(memoryview(compressed_base64.encode('ascii'))[start:]), mime_type
+
+    async def _post_to_compressor(self, image_data) -> httpx.Response:
+        files = {
+            "file": ("image.jpg", BufferReader(image_data), "image/jpeg") # streamed from the upload buffer, no copy
+        }
+
+        response = await get_async_http_client().post(
+            f"{self.compress_service_url}/compress",
+            files=files
+        )
+        response.raise_for_status()
+        return response
+
+    def _encode_image(self, image_data) -> str:
         """
         Fallback method to encode image if the image is not compressed
         """    
-        image_file.seek(0)
-
         # use Python's base64 module to encode the image
-        base64_string = base64.b64encode(image_file.read()).decode('utf-8')
+        base64_string = base64.b64encode(image_data).decode('utf-8')
         return f"data:image/jpeg;base64,{base64_string}"
     
-    async def analyze_image(self, image_file: BytesIO, prompt: str, plant_type: str, plant_species: str) -> dict:
+    async def analyze_image(self, image_data, prompt: str, plant_type: str, plant_species: str) -> dict:
+        """
+        Analyze the image using the Gemini 2 Vision model, serving repeat uploads from the diagnosis cache
+        and sharing one upstream call between concurrent identical requests.
+        `image_data` can be any bytes-like buffer (e.g. a memoryview over the mapped upload).
+        Raises ImageQualityError for photos too poor to diagnose, before compression or any model call.
         """
-        Analyze the image using the Gemini 2 Vision model
+        with STAGE_LATENCY.time(stage="cache_lookup"):
+            # hashing a large upload and the SQLite tier both block, so keep them off the event loop
+            cache_key, cached_result = await asyncio.to_thread(self._cache_lookup, image_data, prompt, plant_type, plant_species)
+        if cached_result is not None:
+            log.debug("diagnosis cache hit", extra={"cache_key": cache_key})
+            return cached_result
+
+        # cached images already passed, so the gate only runs on a miss
+        with STAGE_LATENCY.time(stage="quality_gate"):
+            await asyncio.to_thread(self.quality_gate.check, image_data)
+
+        return await self.inflight.do(cache_key, self._analyze_and_cache, cache_key, image_data, prompt, plant_type, plant_species)
+
+    def _cache_lookup(self, image_data, prompt: str, plant_type: str, plant_species: str):
+        cache_key = self.cache.make_key(image_data, prompt, plant_type, plant_species)
+        return cache_key, self.cache.get(cache_key) if self.cache.enabled else None
+
+    async def _analyze_and_cache(self, cache_key: str, image_data, prompt: str, plant_type: str, plant_species: str) -> dict:
+        analysis_result, cacheable = await self._analyze_image_uncached(image_data, prompt, plant_type, plant_species)
+
+        # a fallback from a failed escalation is served once, but a later upload should get the stronger model
+        if self.cache.enabled and cacheable and analysis_result.get("disease_detected") not in ERROR_DIAGNOSES:
+            await asyncio.to_thread(self.cache.put, cache_key, analysis_result)
+        return analysis_result
+
+    async def _generate(self, model: str, image, config) -> str:
+        """
+        Call one model tier, retrying 429/5xx with backoff and failing fast while Gemini is down
+        """
+        with STAGE_LATENCY.time(stage="gemini_call"), VISION_TIER_LATENCY.time(tier=model), UPSTREAM_IN_FLIGHT.track_inprogress(upstream="gemini"):
+            response = await self.gemini.call(
+                self.client.aio.models.generate_content,
+                model=model,
+                contents=[image, 'Analyze this plant image for diseases and health issues.'],
+                config=config,
+            )
+        return response.text
+
+    def _escalation_reason(self, analysis: dict):
+        """
+        Return why a lower tier's diagnosis should go to the next model, or None to accept it
+        """
+        if analysis["confidence_value"] is None or analysis["confidence_value"] < self.escalate_below_confidence:
+            return "low_confidence"
+        if analysis["severity"] in self.escalate_severities:
+            return "severity"
+        return None
+
+    def _fallback_result(self, fallback: tuple, failed_model: str, error: Exception) -> dict:
+        """
+        A higher tier failed; answer with the lower tier's diagnosis rather than an error
+        """
+        model, analysis_result = fallback
+        log.warning("model tier failed, using the lower tier's diagnosis", extra={"model": failed_model, "fallback_model": model, "error": str(error)})
+        VISION_DIAGNOSES.inc(tier=model)
+        ANALYZE_ERRORS.inc(category="escalation_failed")
+        return analysis_result
+
+    async def _analyze_image_uncached(self, image_data, prompt: str, plant_type: str, plant_species: str) -> tuple:
+        """
+        Compress the image and call the Gemini 2 Vision model. Returns (analysis, cacheable);
+        errors and fallbacks from a failed escalation aren't cacheable
         """
         # encode and compress the image
         try:
-            compressed_base64 = self.encode_and_compress_image(image_file) # compress the image
+            image_bytes, mime_type = await self.prepare_image(image_data) # resize and re-encode the image
 
             # verify the upstream data
-            print("verifying upstream data")
-            print(f"Prompt: {prompt}")
-            print(f"Plant type: {plant_type}")
-            print(f"Plant species: {plant_species}")
+            log.debug("calling vision model", extra={"prompt": prompt, "plant_type": plant_type, "plant_species": plant_species, "image_bytes": len(image_bytes)})
 
             """
             Configure the multimodal inputs
             """
-            if compressed_base64.startswith("data:image"):
-                base64_data = compressed_base64.split(",")[1]
-            else:
-                base64_data = compressed_base64
-
-            if compressed_base64.startswith("data:image/png"):
-                mime_type = "image/png"
-            else:
-                mime_type = "image/jpeg"
-
-            image_bytes = base64.b64decode(base64_data) # decode the base64 data into 
             image = types.Part.from_bytes(
                 data=image_bytes, 
                 mime_type=mime_type
@@ -120,42 +261,67 @@ class Gemini2VisionModel:
                 {user_context_json_string}
             """
             
-            # generate the response
-            response = self.client.models.generate_content(
-                model='gemini-2.0-flash',
-                contents=[image, 'Analyze this plant image for diseases and health issues.'],
-                config=types.GenerateContentConfig(
-                    system_instruction=text_content
-                ),
+            config = types.GenerateContentConfig(
+                system_instruction=text_content,
+                # JSON mode: the reply is the bare object, no fences or prose
+                response_mime_type='application/json',
+                response_schema=ANALYSIS_RESPONSE_SCHEMA
             )
 
-            # get the response content
-            ai_response_content = response.text
+            # walk the model ladder: stop at the first tier whose answer is confident and not severe
+            fallback = None # (model, analysis) of the last lower tier that gave a parseable answer
+            for tier_index, model in enumerate(self.model_ladder):
+                is_last_tier = tier_index == len(self.model_ladder) - 1
+                try:
+                    ai_response_content = await self._generate(model, image, config)
+                except Exception as e:
+                    if fallback is None and is_last_tier:
+                        raise
+                    if fallback is None:
+                        log.warning("model tier failed, escalating", extra={"model": model, "error": str(e)})
+                        VISION_ESCALATIONS.inc(tier=model, reason="error")
+                        continue
+                    return self._fallback_result(fallback, model, e), False
+                parse_started = time.perf_counter()
 
-            # remove the ```json and ``` from the response
-            if ai_response_content.strip().startswith("```"):
-                # Remove triple backticks and optional 'json' after them
-                ai_response_content = re.sub(r"^```(?:json)?\s*", "", ai_response_content.strip(), flags=re.IGNORECASE)
-                ai_response_content = re.sub(r"\s*```$", "", ai_response_content.strip())
+                # parse and normalize the response, recovering the object from fenced, chatty or truncated output
+                try:
+                    analysis_result, repaired = parse_analysis(ai_response_content)
+                    STAGE_LATENCY.observe(time.perf_counter() - parse_started, stage="json_parse")
+                    if repaired:
+                        log.debug("repaired AI response JSON", extra={"response": ai_response_content[:500]})
+                        ANALYZE_ERRORS.inc(category="json_repaired")
+                    reason = None if is_last_tier else self._escalation_reason(analysis_result)
+                except ResponseParseError as e:
+                    if is_last_tier:
+                        if fallback is None:
+                            raise
+                        return self._fallback_result(fallback, model, e), False
+                    reason = "parse_error"
+                else:
+                    fallback = (model, analysis_result)
 
-            # Attempt to parse the AI's response content as JSON
-            try:
-                analysis_result = json.loads(ai_response_content)
-                return analysis_result
-            
-            except json.JSONDecodeError:
-                print(f"Failed to decode AI response as JSON: {ai_response_content}")
-                return { # Return an error structure if JSON parsing fails
-                    "disease_detected": "JSON Decode Error",
-                    "confidence": "0%",
-                    "severity": "Unknown",
-                    "recommendations": ["AI response was not valid JSON.", ai_response_content[:200] + "..."], # Include part of the bad response
-                    "plant_health": "Unknown",
-                    "extra_info": "Unknown"
-                }
+                if reason is None:
+                    VISION_DIAGNOSES.inc(tier=model)
+                    return analysis_result, True
+                log.debug("escalating diagnosis", extra={"model": model, "reason": reason})
+                VISION_ESCALATIONS.inc(tier=model, reason=reason)
+
+        except ResponseParseError as e:
+            log.warning("failed to decode AI response as JSON", extra={"error": str(e), "response": e.text[:500]})
+            ANALYZE_ERRORS.inc(category="json_decode")
+            return { # Return an error structure if JSON parsing fails
+                "disease_detected": "JSON Decode Error",
+                "confidence": "0%",
+                "severity": "Unknown",
+                "recommendations": ["AI response was not valid JSON.", e.text[:200] + "..."], # Include part of the bad response
+                "plant_health": "Unknown",
+                "extra_info": "Unknown"
+            }, False
 
         except json.JSONDecodeError as e: # This might be redundant now with the one above
-            print(f"Outer JSONDecodeError (should be caught by inner try-except): {e}")
+            log.warning("outer JSONDecodeError (should be caught by inner try-except)", extra={"error": str(e)})
+            ANALYZE_ERRORS.inc(category="json_decode")
             return {
                 "disease_detected": "Analysis Error",
                 "confidence": "0%",
@@ -163,9 +329,10 @@ class Gemini2VisionModel:
                 "recommendations": ["Unable to parse AI response"],
                 "plant_health": "Unknown",
                 "extra_info": "Unknown"
-            }
+            }, False
         except Exception as e:
-            print(f"Gemini Vision error: {e}")
+            log.error("Gemini Vision error", extra={"error": str(e)})
+            ANALYZE_ERRORS.inc(category="vision_error")
             return {
                 "disease_detected": "Gemini Vision Model Error",
                 "confidence": "0%",
@@ -173,4 +340,4 @@ class Gemini2VisionModel:
                 "recommendations": [f"Error during API call or processing: {str(e)}"],
                 "plant_health": "Unknown",
                 "extra_info": "Unknown"
-            }
+            }, False
@@ -0,0 +1,141 @@
+"""
+Production entry point: runs app.py under gunicorn with threaded worker processes.
+
+Heavy libraries are imported once in the master so forked workers share them. Each worker then
+imports app.py itself, so the Gemini client, connection pools, event loop and job queue threads
+are built after the fork, never shared between processes. Workers warm up before taking traffic,
+report their startup time, and drain in-flight requests and jobs on SIGTERM.
+
+Usage: python server.py
+"""
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError: # gunicorn doesn't run on Windows; use `python app.py` there
+    BaseApplication = object
+
+from utils.logging_config import configure_logging, get_logger
+
+load_dotenv()
+configure_logging()
+log = get_logger("server")
+
+
+def preload_libraries() -> float:
+    """
+    Import the expensive dependencies in the master, before forking, and return how long it took
+    """
+    started = time.monotonic()
+    import flask # noqa: F401
+    import google.genai # noqa: F401
+    import httpx # noqa: F401
+    import PIL.Image
+    import reportlab.pdfgen.canvas # noqa: F401
+    PIL.Image.init() # register the codec plugins
+    return time.monotonic() - started
+
+
+def share_state_between_workers(workers: int) -> dict:
+    """
+    With more than one worker, default the per-process stores to shared files, so a report, a
+    cached diagnosis or a chat created on one worker is visible to the others. Explicit settings
+    (even empty ones) are kept. The job queue, admission control and history already default to
+    shared files. Returns the defaults that were applied.
+    """
+    if workers <= 1:
+        return {}
+    shared = {
+        'REPORT_STORE_DIR': os.path.join(tempfile.gettempdir(), 'doctor_plant_reports'),
+        'DIAGNOSIS_CACHE_DB': os.path.join(tempfile.gettempdir(), 'doctor_plant_cache.db'),
+        'CHAT_SESSION_DB': os.path.join(tempfile.gettempdir(), 'doctor_plant_chat.db'),
+    }
+    applied = {name: path for name, path in shared.items() if name not in os.environ}
+    os.environ.update(applied) # set in the master, so every forked worker inherits them
+    return applied
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    import app as app_module
+
+    app_module.warm_up(started_at=worker.forked_at)
+
+    # gunicorn stops accepting and finishes in-flight requests on SIGTERM; also flip readiness
+    # and stop claiming queued jobs right away
+    gunicorn_handler = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        app_module.begin_drain()
+        gunicorn_handler(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    import app as app_module
+
+    app_module.shutdown(timeout=server.cfg.graceful_timeout)
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5050)}",
+        "workers": int(os.getenv('WEB_CONCURRENCY', 2)),
+        "threads": int(os.getenv('WEB_THREADS', 16)), # request threads mostly wait on the shared event loop
+        "worker_class": "gthread",
+        "timeout": int(os.getenv('WORKER_TIMEOUT', 120)),
+        "graceful_timeout": int(os.getenv('SHUTDOWN_GRACE_SECONDS', 30)),
+        "keepalive": int(os.getenv('KEEPALIVE_SECONDS', 5)),
+        "max_requests": int(os.getenv('WORKER_MAX_REQUESTS', 0)),
+        "max_requests_jitter": int(os.getenv('WORKER_MAX_REQUESTS_JITTER', 0)),
+        "preload_app": False, # app.py is imported per worker, after the fork
+        "accesslog": os.getenv('ACCESS_LOG') or None,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+    }
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        import app as app_module
+        return app_module.app
+
+
+def main():
+    if BaseApplication is object:
+        log.error("gunicorn is not installed; install requirements.txt, or run `python app.py` for development")
+        sys.exit(1)
+
+    preload_seconds = preload_libraries()
+    options = gunicorn_options()
+    shared_defaults = share_state_between_workers(options["workers"])
+    if shared_defaults:
+        log.info("sharing per-process stores between workers", extra={"shared_defaults": shared_defaults})
+    log.info("starting production server", extra={
+        "bind": options["bind"], "workers": options["workers"], "threads": options["threads"],
+        "preload_seconds": round(preload_seconds, 3)
+    })
+    ProductionServer(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import time
+
+from utils.admission import AdmissionController
+
+
+def test_held_slots_outlive_their_ttl(tmp_path):
+    admission = AdmissionController(str(tmp_path / "admission.db"), rate=0, max_concurrent=2, slot_ttl=0.3)
+    held = admission.admit(slots=2)
+    time.sleep(0.6) # two TTLs; the heartbeat keeps the lease alive
+    assert admission.stats()["interactive_in_use"] == 2
+
+    held.release()
+    assert admission.stats()["interactive_in_use"] == 0
+    with admission.admit(slots=1) as again:
+        assert again.slots == 1
+
+
+def test_unrenewed_slots_are_reclaimed(tmp_path):
+    db_path = str(tmp_path / "admission.db")
+    crashed = AdmissionController(db_path, rate=0, max_concurrent=1, slot_ttl=0.3)
+    crashed.admit(slots=1)
+    with crashed._held_lock:
+        crashed._held.clear() # as if the worker holding the slot had died
+    time.sleep(0.5)
+    assert AdmissionController(db_path, rate=0, max_concurrent=1, slot_ttl=0.3).stats()["interactive_in_use"] == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from utils.history_store import HistoryStore, _encode_cursor
+
+SPECIES = ["Rosa", "malus domestica", "Ocimum basilicum", "Pyrus communis", "Capsicum annuum"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(db_path=str(tmp_path / "history.db"), blob_dir=str(tmp_path / "images"))
+    # repeated species and confidences, so pages split inside runs of equal sort values
+    for index in range(25):
+        store.record({"plant_species": SPECIES[index % len(SPECIES)], "disease_detected": "Black spot",
+                      "confidence": f"{50 + index % 3 * 10}%", "confidence_value": 50.0 + index % 3 * 10,
+                      "severity": "low", "plant_health": "good"})
+    store.flush()
+    yield store
+    store.close()
+
+
+def all_pages(store, sort: str, limit: int) -> list:
+    items, cursor = [], None
+    while True:
+        page = store.query(sort=sort, limit=limit, cursor=cursor)
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_keyset_pages_follow_the_sort(store):
+    by_name = all_pages(store, "name", 4)
+    assert len({item["id"] for item in by_name}) == 25
+    assert [item["species"].lower() for item in by_name] == sorted(item["species"].lower() for item in by_name)
+
+    first = store.query(sort="confidence", limit=10)
+    second = store.query(sort="confidence", limit=10, cursor=first["next_cursor"])
+    values = [item["confidence_value"] for item in first["items"] + second["items"]]
+    assert values == sorted(values, reverse=True)
+    assert not {item["id"] for item in first["items"]} & {item["id"] for item in second["items"]}
+    assert len(all_pages(store, "confidence", 10)) == 25
+
+
+def test_malformed_cursors_are_rejected(store):
+    for cursor in ("not base64!", _encode_cursor([1.0, 2.0]), _encode_cursor([{"a": 1}, 1.0, "x"]),
+                   _encode_cursor([True, 1.0, "x"])):
+        with pytest.raises(ValueError):
+            store.query(sort="confidence", cursor=cursor)
+
+
+def test_full_write_queue_drops_instead_of_queueing(tmp_path):
+    store = HistoryStore(db_path=str(tmp_path / "history.db"), blob_dir=str(tmp_path / "images"), max_pending=0)
+    assert store.record({"plant_species": "Rosa"}) is None
+    store.flush()
+    assert store.stats()["diagnoses"] == 0
+    store.close()
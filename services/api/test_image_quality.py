@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+from benchmarks.bench_quality_gate import encode, make_sample
+from utils.image_quality import ImageQualityError, ImageQualityGate
+
+SIZE = (800, 600)
+
+
+def rejected_checks(gate, category: str) -> list:
+    with pytest.raises(ImageQualityError) as error:
+        gate.check(encode(make_sample(random.Random(1), category, SIZE)))
+    assert all(issue["message"] for issue in error.value.issues)
+    return [issue["check"] for issue in error.value.issues]
+
+
+def test_quality_gate_passes_usable_photos():
+    gate = ImageQualityGate(enabled=True)
+    for category in ("healthy", "diseased", "red_leaf"):
+        gate.check(encode(make_sample(random.Random(1), category, SIZE)))
+
+
+def test_quality_gate_rejects_with_the_failing_check():
+    gate = ImageQualityGate(enabled=True)
+    assert "blur" in rejected_checks(gate, "very_blurry")
+    assert "exposure" in rejected_checks(gate, "dark")
+    assert "resolution" in rejected_checks(gate, "low_resolution")
+    assert "plant" in rejected_checks(gate, "no_plant")
+
+
+def test_quality_gate_lets_undecodable_and_disabled_through():
+    ImageQualityGate(enabled=True).check(b"not an image")
+    ImageQualityGate(enabled=False).check(encode(make_sample(random.Random(1), "dark", SIZE)))
@@ -0,0 +1,19 @@
+from benchmarks import loadtest
+
+
+def test_offline_pipeline():
+    """Drive /analyze, /chat and /download-pdf against the stub Gemini and compressor and expect no errors"""
+    summary = loadtest.main([
+        "--scenario", "mixed",
+        "--requests", "60",
+        "--concurrency", "4",
+        "--unique-images", "5",
+        "--image-size", "128",
+        "--gemini-latency", "0.01",
+        "--compress-latency", "0",
+    ])
+
+    assert summary["endpoints"]["analyze"]["requests"] > 0
+    for endpoint, stats in summary["endpoints"].items():
+        assert stats["errors"] == 0, f"{endpoint}: {stats['error_detail']}"
+    assert summary["diagnosis_cache"]["hits"] > 0
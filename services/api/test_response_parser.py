@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from benchmarks.stubs import STUB_ANALYSIS
+from utils.response_parser import ResponseParseError, extract_json_object, parse_analysis
+
+
+def test_parse_analysis_bare_json():
+    analysis, repaired = parse_analysis(json.dumps(STUB_ANALYSIS))
+    assert not repaired
+    assert analysis["disease_detected"] == "Early blight"
+    assert analysis["confidence"] == "87%" and analysis["confidence_value"] == 87.0
+
+
+def test_parse_analysis_recovers_fenced_chatty_and_truncated_output():
+    fenced = "Here you go:\n```json\n" + json.dumps(STUB_ANALYSIS, indent=2) + "\n```\nAnything else?"
+    assert parse_analysis(fenced) == (parse_analysis(json.dumps(STUB_ANALYSIS))[0], True)
+
+    truncated, repaired = parse_analysis('{"disease_detected": "Rust", "confidence": 0.8, "recommendations": ["Prune", "Spr')
+    assert repaired
+    assert truncated["recommendations"] == ["Prune"]
+    assert truncated["confidence"] == "80%"
+
+
+def test_extract_json_object_handles_braces_in_strings_and_trailing_commas():
+    text = 'note {"a": "x } y", "b": [1, 2,],} trailing {"c": 1}'
+    assert json.loads(extract_json_object(text)) == {"a": "x } y", "b": [1, 2]}
+
+
+def test_parse_analysis_normalizes_enums():
+    analysis, _ = parse_analysis('{"disease_detected": "Scab", "severity": "Moderate", "plant_health": "60%"}')
+    assert analysis["severity"] == "medium"
+    assert analysis["plant_health"] == "fair"
+
+
+def test_parse_analysis_rejects_unusable_text():
+    for text in ("no json here", '{"confidence": "50%"}', "[1, 2]"):
+        with pytest.raises(ResponseParseError):
+            parse_analysis(text)
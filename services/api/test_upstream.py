@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from utils.upstream import CircuitBreaker, CircuitOpenError, Upstream
+
+
+def upstream_with_breaker() -> Upstream:
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    return Upstream("test", max_attempts=1, base_delay=0, breaker=breaker)
+
+
+async def fail(code: int):
+    raise genai_errors.APIError(code, {"error": {"code": code, "message": "upstream said no"}})
+
+
+async def succeed():
+    return "ok"
+
+
+def test_breaker_opens_half_opens_and_closes():
+    upstream = upstream_with_breaker()
+    for _ in range(2):
+        with pytest.raises(genai_errors.APIError):
+            asyncio.run(upstream.call(fail, 503))
+    assert upstream.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstream.call(succeed))
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert upstream.breaker.state == "half-open"
+    # a failed trial reopens the breaker straight away
+    with pytest.raises(genai_errors.APIError):
+        asyncio.run(upstream.call(fail, 503))
+    assert upstream.breaker.state == "open" and upstream.breaker.times_opened == 2
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert asyncio.run(upstream.call(succeed)) == "ok"
+    assert upstream.breaker.state == "closed" and not upstream.breaker.trial_in_flight
+
+
+def test_client_errors_count_as_healthy():
+    upstream = upstream_with_breaker()
+    for _ in range(3):
+        with pytest.raises(genai_errors.APIError):
+            asyncio.run(upstream.call(fail, 400))
+    assert upstream.breaker.state == "closed" and upstream.breaker.failures == 0
+
+
+def test_cancelled_trial_frees_the_breaker():
+    upstream = upstream_with_breaker()
+    upstream.breaker.opened_at = 0 # long past the reset timeout: half-open
+
+    async def cancel_trial():
+        task = asyncio.create_task(upstream.call(asyncio.sleep, 10))
+        await asyncio.sleep(0)
+        assert upstream.breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert not upstream.breaker.trial_in_flight
+    assert asyncio.run(upstream.call(succeed)) == "ok"
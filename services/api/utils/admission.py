@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from utils.logging_config import get_logger
+from utils.metrics import ADMISSION_DECISIONS
+from utils.storage import ThreadLocalSQLite
+
+log = get_logger("admission")
+
+# priority lanes, highest first; lower lanes only get a share of the global concurrency
+LANES = ("interactive", "batch")
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is turned away: the client is over its rate limit ('rate_limited')
+    or every Gemini slot its lane may use is taken ('over_capacity')
+    """
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+        message = "Rate limit exceeded" if reason == 'rate_limited' else "Service is at capacity"
+        super().__init__(f"{message}; retry in {retry_after:.0f}s")
+
+
+class Admission:
+    """
+    Slots held by one admitted request; release them when its Gemini calls are done
+    """
+    def __init__(self, controller, slot_id: str, slots: int):
+        self.controller = controller
+        self.slot_id = slot_id
+        self.slots = slots
+
+    def release(self):
+        if self.slot_id is not None:
+            self.controller._release(self.slot_id)
+            self.slot_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Admission control in front of the Gemini-backed endpoints.
+
+    Each client (API key or IP) has a token bucket refilled at `rate` tokens per second up to
+    `burst`. On top of that, at most `max_concurrent` admitted requests hold a slot at once,
+    across every worker process, so together they stay inside the upstream quota. The batch
+    lane may only use `batch_share` of those slots; the rest are kept for interactive requests.
+    Requests that don't fit are rejected immediately with a retry hint rather than queued.
+
+    Buckets and slots live in a local SQLite file shared by every worker process pointed at it.
+    Slots have a lease that a heartbeat renews while they are held, so only the slots of a
+    worker that died are reclaimed, however long a stream holds them.
+    """
+    def __init__(self, db_path: str = None, rate: float = None, burst: float = None, max_concurrent: int = None,
+                 batch_share: float = None, slot_ttl: float = None):
+        self.db_path = db_path or os.getenv('ADMISSION_DB', os.path.join(tempfile.gettempdir(), 'doctor_plant_admission.db'))
+        self.rate = rate if rate is not None else float(os.getenv('ADMISSION_RATE', 0)) # 0 disables per-client limits
+        self.burst = burst if burst is not None else float(os.getenv('ADMISSION_BURST', 10))
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(os.getenv('ADMISSION_MAX_CONCURRENT', 16)) # 0 disables the cap
+        self.batch_share = batch_share if batch_share is not None else float(os.getenv('ADMISSION_BATCH_SHARE', 0.5))
+        self.slot_ttl = slot_ttl if slot_ttl is not None else float(os.getenv('ADMISSION_SLOT_TTL', 300))
+
+        # isolation_level=None so transactions are explicit (BEGIN IMMEDIATE)
+        self._connections = ThreadLocalSQLite(self.db_path, isolation_level=None)
+        self._last_cleanup = 0.0
+        self._held = set() # slot IDs this process holds, renewed by the heartbeat
+        self._held_lock = threading.Lock()
+        self._heartbeat = None
+
+        db = self._db()
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS slots ("
+                "id TEXT PRIMARY KEY, lane TEXT NOT NULL, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_slots_expires ON slots (expires_at)")
+
+    def lane_capacity(self, lane: str) -> int:
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        if lane == 'interactive':
+            return self.max_concurrent
+        return max(1, int(self.max_concurrent * self.batch_share))
+
+    def admit(self, client: str = None, lane: str = 'interactive', slots: int = 1, cost: float = 1.0,
+              wait: float = 0) -> Admission:
+        """
+        Charge `cost` tokens to `client` (None skips the rate limit) and take `slots` concurrency
+        slots in `lane` (0 takes none, e.g. for work that is queued; negative counts raise
+        ValueError). Requests for more slots than the lane has are granted the whole lane;
+        check `Admission.slots`.
+
+        Raises AdmissionRejected right away, unless `wait` is set, in which case capacity
+        rejections are retried for up to `wait` seconds (rate limits are never waited on).
+        """
+        if slots < 0:
+            raise ValueError(f"Invalid slot count: {slots}")
+        slots = min(slots, self.lane_capacity(lane)) if self.max_concurrent > 0 else 0
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                admission = self._try_admit(client, lane, slots, cost)
+                ADMISSION_DECISIONS.inc(lane=lane, result="admitted")
+                return admission
+            except AdmissionRejected as e:
+                remaining = deadline - time.monotonic()
+                if e.reason == 'rate_limited' or remaining <= 0:
+                    ADMISSION_DECISIONS.inc(lane=lane, result=e.reason)
+                    raise
+                time.sleep(min(0.25, remaining))
+
+    def stats(self) -> dict:
+        db = self._db()
+        rows = db.execute("SELECT lane, SUM(count) FROM slots WHERE expires_at >= ? GROUP BY lane", (time.time(),)).fetchall()
+        in_use = {lane: count for lane, count in rows}
+        stats = {"max_concurrent": self.max_concurrent, "clients": db.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]}
+        for lane in LANES:
+            stats[f"{lane}_in_use"] = in_use.get(lane, 0)
+            stats[f"{lane}_capacity"] = self.lane_capacity(lane)
+        return stats
+
+    def _try_admit(self, client: str, lane: str, slots: int, cost: float) -> Admission:
+        self._cleanup()
+        db = self._db()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE") # one admission decision at a time, across processes
+
+            tokens = None
+            if client is not None and self.rate > 0:
+                row = db.execute("SELECT tokens, updated_at FROM buckets WHERE client = ?", (client,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                if tokens < cost:
+                    raise AdmissionRejected('rate_limited', (cost - tokens) / self.rate)
+
+            slot_id = None
+            if slots > 0:
+                db.execute("DELETE FROM slots WHERE expires_at < ?", (now,))
+                total, in_lane = db.execute(
+                    "SELECT COALESCE(SUM(count), 0), COALESCE(SUM(CASE WHEN lane = ? THEN count END), 0) FROM slots", (lane,)
+                ).fetchone()
+                if total + slots > self.max_concurrent or in_lane + slots > self.lane_capacity(lane):
+                    raise AdmissionRejected('over_capacity', 1.0)
+                slot_id = uuid.uuid4().hex
+                db.execute("INSERT INTO slots (id, lane, count, expires_at) VALUES (?, ?, ?, ?)",
+                           (slot_id, lane, slots, now + self.slot_ttl))
+
+            # only charge the client once the request is actually admitted
+            if tokens is not None:
+                db.execute("INSERT OR REPLACE INTO buckets (client, tokens, updated_at) VALUES (?, ?, ?)",
+                           (client, tokens - cost, now))
+        if slot_id is not None:
+            self._hold(slot_id)
+        return Admission(self, slot_id, slots)
+
+    def _hold(self, slot_id: str):
+        with self._held_lock:
+            self._held.add(slot_id)
+            # started on demand, so each worker process runs its own after forking
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._renew, name="admission-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _renew(self):
+        """
+        Extend the lease of every slot this process holds every third of the TTL, until none are held
+        """
+        while True:
+            time.sleep(self.slot_ttl / 3)
+            with self._held_lock:
+                held = list(self._held)
+                if not held:
+                    self._heartbeat = None
+                    return
+            try:
+                db = self._db()
+                expires_at = time.time() + self.slot_ttl
+                with db:
+                    db.executemany("UPDATE slots SET expires_at = ? WHERE id = ?", [(expires_at, slot_id) for slot_id in held])
+            except sqlite3.Error as e:
+                log.warning("failed to renew admission slots", extra={"slots": len(held), "error": str(e)})
+
+    def _release(self, slot_id: str):
+        with self._held_lock:
+            self._held.discard(slot_id)
+        try:
+            self._db().execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+        except sqlite3.Error as e:
+            # the slot's lease runs out on its own
+            log.warning("failed to release admission slot", extra={"slot_id": slot_id, "error": str(e)})
+
+    def _cleanup(self):
+        """
+        Forget clients whose buckets have refilled, at most once a minute
+        """
+        now = time.time()
+        if now - self._last_cleanup < 60 or self.rate <= 0:
+            return
+        self._last_cleanup = now
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.burst / self.rate,))
+
+    def _db(self) -> sqlite3.Connection:
+        return self._connections.get()
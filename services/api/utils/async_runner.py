@@ -0,0 +1,72 @@
+import asyncio
+import queue
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop, starting its thread on first use
+    """
+    global _loop
+    if _loop is not None and not _loop.is_closed():
+        return _loop
+
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-runner", daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def run_async(coro, timeout: float = None):
+    """
+    Run a coroutine on the shared event loop and block the calling (worker) thread until it finishes.
+
+    Every request thread submits to the same long-lived loop, so upstream I/O from many
+    in-flight requests overlaps instead of each request spinning up its own loop with asyncio.run.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    return future.result(timeout)
+
+
+def submit_async(coro):
+    """
+    Schedule a coroutine on the shared event loop without waiting for it
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def iterate_async(async_iterable, timeout: float = None):
+    """
+    Consume an async iterator on the shared event loop from a synchronous (worker thread) generator,
+    yielding each item as soon as the loop produces it
+    """
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in async_iterable:
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            items.put((done, None))
+
+    future = submit_async(pump())
+    try:
+        while True:
+            item, error = items.get(timeout=timeout)
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # stop the upstream stream if the client went away mid-response
+        future.cancel()
@@ -0,0 +1,57 @@
+import asyncio
+import queue
+import time
+
+# sentinel pushed onto the result queue once every item has finished
+BATCH_DONE = object()
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket that paces upstream calls to a fixed rate across every batch in the process.
+    A rate of 0 disables limiting.
+    """
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        self.rate_per_second = rate_per_second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self.rate_per_second <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate_per_second)
+
+
+async def fan_out(items: list, worker, concurrency: int, rate_limiter: AsyncRateLimiter, results: queue.Queue):
+    """
+    Run `worker(index, item)` for every item with at most `concurrency` calls in flight,
+    pushing (index, result) onto `results` as each one completes and BATCH_DONE at the end
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(index, item):
+        async with semaphore:
+            await rate_limiter.acquire()
+            try:
+                result = await worker(index, item)
+            except Exception as e:
+                result = e
+        results.put((index, result))
+
+    try:
+        await asyncio.gather(*(run_one(index, item) for index, item in enumerate(items)))
+    finally:
+        results.put(BATCH_DONE)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from utils.logging_config import get_logger
+from utils.storage import ThreadLocalSQLite
+
+log = get_logger("chat_session_pool")
+
+
+class ChatSessionPool:
+    """
+    Bounded pool of per-conversation chat sessions keyed by a client-supplied session ID.
+
+    Sessions idle for longer than the TTL are dropped, and the least recently used session is
+    evicted when the pool is full. Access happens on the shared event loop, so no thread lock is needed.
+
+    When CHAT_SESSION_DB is set, every session's history is also saved to that SQLite file after
+    each turn, so a conversation can continue on any worker process pointed at the same file.
+    A session is rebuilt from the file when this process hasn't seen it or another process has
+    saved a newer turn. Those SQLite calls run in worker threads, so a write locked by another
+    process never stalls the event loop.
+    """
+    def __init__(self, factory, max_sessions: int = None, idle_ttl_seconds: float = None, db_path: str = None):
+        self.factory = factory # (history: list of Content dicts or None) -> chat session
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv('CHAT_MAX_SESSIONS', 1000))
+        self.idle_ttl_seconds = idle_ttl_seconds if idle_ttl_seconds is not None else float(os.getenv('CHAT_SESSION_IDLE_TTL', 30 * 60))
+        self.db_path = db_path if db_path is not None else os.getenv('CHAT_SESSION_DB', '')
+
+        # session_id -> [chat, last_used, lock, saved version]
+        self._sessions = OrderedDict()
+        self.evictions = 0
+
+        self._disk = None
+        self._last_cleanup = 0.0
+        if self.db_path:
+            self._disk = ThreadLocalSQLite(self.db_path, timeout=5, isolation_level=None)
+            self._disk.get().execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "id TEXT PRIMARY KEY, history TEXT NOT NULL, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    async def acquire(self, session_id: str):
+        """
+        Return (chat, lock) for the session, creating it if needed; hold the lock while sending so turns stay ordered
+        """
+        saved = None
+        if self._disk is not None:
+            try:
+                saved = await asyncio.to_thread(self._load, session_id)
+            except sqlite3.Error as e:
+                log.warning("failed to load chat session", extra={"session_id": session_id, "error": str(e)})
+
+        # no awaits from here on, so the pool can't change under us
+        now = time.monotonic()
+        self._evict_idle(now)
+        entry = self._sessions.get(session_id)
+        if entry is not None and saved is not None and saved[0] > entry[3]:
+            # another worker has moved the conversation on since this one last saw it
+            entry[0], entry[3] = self.factory(saved[1]), saved[0]
+        if entry is None:
+            version, history = saved if saved is not None else (0, None)
+            entry = [self.factory(history), now, asyncio.Lock(), version]
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        else:
+            entry[1] = now
+            self._sessions.move_to_end(session_id)
+        return entry[0], entry[2]
+
+    def replace(self, session_id: str, chat):
+        """
+        Swap in a new chat object for the session, e.g. one rebuilt from a truncated history
+        """
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            entry[0] = chat
+
+    async def save(self, session_id: str, chat):
+        """
+        Persist the session's history after a turn, if sessions are shared through CHAT_SESSION_DB
+        """
+        entry = self._sessions.get(session_id)
+        if self._disk is None or entry is None:
+            return
+        history = json.dumps([content.model_dump(mode='json', exclude_none=True) for content in chat.get_history()])
+        cleanup = time.time() - self._last_cleanup >= 60
+        if cleanup:
+            self._last_cleanup = time.time()
+        try:
+            entry[3] = await asyncio.to_thread(self._store, session_id, history, cleanup)
+        except sqlite3.Error as e:
+            # the reply already went out; other workers just won't see this turn
+            log.warning("failed to save chat session", extra={"session_id": session_id, "error": str(e)})
+
+    async def close(self, session_id: str = None):
+        """
+        Drop one session, including its saved history, or every session held in this process
+        """
+        if session_id is None:
+            self._sessions.clear()
+            return
+        self._sessions.pop(session_id, None)
+        if self._disk is not None:
+            await asyncio.to_thread(self._delete, session_id)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "evictions": self.evictions}
+
+    def _store(self, session_id: str, history: str, cleanup: bool) -> int:
+        db = self._disk.get()
+        now = time.time()
+        version = db.execute(
+            "INSERT INTO chat_sessions (id, history, version, updated_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (id) DO UPDATE SET history = excluded.history, version = version + 1, updated_at = excluded.updated_at "
+            "RETURNING version", (session_id, history, now)
+        ).fetchone()[0]
+        if cleanup:
+            db.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.idle_ttl_seconds,))
+        return version
+
+    def _delete(self, session_id: str):
+        self._disk.get().execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+
+    def _load(self, session_id: str):
+        row = self._disk.get().execute("SELECT version, history, updated_at FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[2] >= self.idle_ttl_seconds:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _evict_idle(self, now: float):
+        # sessions are ordered by last use, so expired ones are at the front
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry[1] < self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
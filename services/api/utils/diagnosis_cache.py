@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+
+from utils.logging_config import get_logger
+from utils.storage import ThreadLocalSQLite
+from utils.uploads import BufferReader
+
+log = get_logger("diagnosis_cache")
+
+
+class DiagnosisCache:
+    """
+    Content-addressed cache for vision model diagnoses.
+
+    Entries are keyed on a hash of the image bytes (or a perceptual hash of the
+    image when phash mode is on) plus the normalized user context. The memory tier
+    is an LRU with a TTL and entry/byte limits; the optional disk tier is a SQLite
+    file shared by every worker that points at the same path.
+    """
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl_seconds: float = None,
+                 disk_path: str = None, disk_max_entries: int = None, use_phash: bool = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('DIAGNOSIS_CACHE_MAX_ENTRIES', 512))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('DIAGNOSIS_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('DIAGNOSIS_CACHE_TTL', 24 * 60 * 60))
+        self.disk_path = disk_path if disk_path is not None else os.getenv('DIAGNOSIS_CACHE_DB', '')
+        self.disk_max_entries = disk_max_entries if disk_max_entries is not None else int(os.getenv('DIAGNOSIS_CACHE_DISK_MAX_ENTRIES', 50000))
+        if use_phash is None:
+            use_phash = os.getenv('DIAGNOSIS_CACHE_PHASH', '').lower() in ('1', 'true', 'yes')
+        self.use_phash = use_phash
+
+        # key -> (expires_at, size_in_bytes, result)
+        self._entries = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._disk = None
+        if self.disk_path:
+            self._disk = ThreadLocalSQLite(self.disk_path, timeout=5)
+            db = self._disk.get()
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS diagnosis_cache ("
+                    "key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS idx_diagnosis_cache_expires ON diagnosis_cache (expires_at)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self._disk is not None
+
+    def make_key(self, image_data, prompt: str, plant_type: str, plant_species: str) -> str:
+        """
+        Build the cache key from the image fingerprint and the normalized user context
+        """
+        image_fingerprint = None
+        if self.use_phash:
+            image_fingerprint = self._perceptual_hash(image_data)
+        if image_fingerprint is None:
+            image_fingerprint = "sha256:" + hashlib.sha256(image_data).hexdigest()
+
+        context = "\x1f".join(self._normalize(value) for value in (plant_type, plant_species, prompt))
+        context_hash = hashlib.sha256(context.encode('utf-8')).hexdigest()
+        return f"{image_fingerprint}|{context_hash}"
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                self._remove(key)
+
+        result = self._disk_get(key, now)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # promote disk hits to the memory tier
+        self._memory_put(key, result, now + self.ttl_seconds)
+        return result
+
+    def put(self, key: str, result: dict):
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_put(key, result, expires_at)
+        self._disk_put(key, result, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+        if self._disk is not None:
+            db = self._disk.get()
+            with db:
+                db.execute("DELETE FROM diagnosis_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "phash": self.use_phash,
+                "disk": self._disk is not None,
+            }
+
+    def _memory_put(self, key: str, result: dict, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, result)
+            self._current_bytes += size
+            # evict least recently used entries until we're back under both limits
+            while len(self._entries) > self.max_entries or self._current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._current_bytes -= size
+
+    def _disk_get(self, key: str, now: float):
+        if self._disk is None:
+            return None
+        row = self._disk.get().execute(
+            "SELECT result FROM diagnosis_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+
+    def _disk_put(self, key: str, result: dict, expires_at: float):
+        if self._disk is None:
+            return
+        db = self._disk.get()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO diagnosis_cache (key, result, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(result, default=str), expires_at)
+            )
+            # drop expired rows, then the soonest-to-expire rows if we're over the limit
+            db.execute("DELETE FROM diagnosis_cache WHERE expires_at <= ?", (time.time(),))
+            db.execute(
+                "DELETE FROM diagnosis_cache WHERE key IN ("
+                "SELECT key FROM diagnosis_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
+
+    @staticmethod
+    def _normalize(value: str) -> str:
+        return " ".join((value or "").split()).lower()
+
+    @staticmethod
+    def _perceptual_hash(image_data, hash_size: int = 8):
+        """
+        Difference hash (dHash) of the image, so re-encoded or resized copies of the same photo share a key
+        """
+        try:
+            with Image.open(BufferReader(image_data)) as img:
+                img.draft('L', (hash_size * 8, hash_size * 8)) # cheap JPEG downscale on decode
+                pixels = list(img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+        except Exception as e:
+            log.warning("error computing perceptual hash", extra={"error": str(e)})
+            return None
+
+        bits = 0
+        for row in range(hash_size):
+            for col in range(hash_size):
+                left = pixels[row * (hash_size + 1) + col]
+                right = pixels[row * (hash_size + 1) + col + 1]
+                bits = (bits << 1) | (1 if left > right else 0)
+        return f"dhash:{bits:0{hash_size * hash_size // 4}x}"
@@ -0,0 +1,336 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from utils.image_preprocess import ImagePreprocessor
+from utils.logging_config import get_logger
+from utils.metrics import HISTORY_WRITES
+from utils.response_parser import normalize_confidence
+from utils.storage import ThreadLocalSQLite, write_atomic
+
+log = get_logger("history_store")
+
+IMAGE_SHA_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+HISTORY_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+HEALTH_RANK = {"excellent": 5, "good": 4, "fair": 3, "poor": 2, "critical": 1}
+
+# sort name -> (column, direction); every sort is keyset-paginated on (column, created_at, id)
+SORTS = {
+    "date": (None, "DESC"),
+    "confidence": ("confidence_value", "DESC"),
+    "health": ("health_rank", "DESC"),
+    "name": ("species_key", "ASC"),
+}
+
+
+class HistoryStore:
+    """
+    SQLite-backed history of every successful diagnosis, for the plant library.
+
+    Each diagnosis is one row with its filterable fields (species, disease, severity, health,
+    confidence, date) in indexed columns and the full analysis as JSON. Images are kept as
+    content-addressed files named by the SHA-256 of their bytes, so a re-uploaded photo is
+    stored once and rows only hold the hash. Pages are fetched with keyset pagination, so
+    a page costs the same however deep into the history it is.
+
+    Writes (thumbnailing the image, then one insert) run on a background thread, off the
+    request path. At most `max_pending` writes wait at once, each holding its upload; beyond
+    that, new diagnoses are dropped from history (and counted) rather than queued.
+    """
+    def __init__(self, db_path: str = None, blob_dir: str = None, image_edge: int = None,
+                 page_size: int = None, max_page_size: int = None, max_pending: int = None):
+        data_dir = os.getenv('HISTORY_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+        self.db_path = db_path or os.getenv('HISTORY_DB', os.path.join(data_dir, 'history.db'))
+        self.blob_dir = blob_dir or os.getenv('HISTORY_BLOB_DIR', os.path.join(data_dir, 'images'))
+        self.page_size = page_size if page_size is not None else int(os.getenv('HISTORY_PAGE_SIZE', 24))
+        self.max_page_size = max_page_size if max_page_size is not None else int(os.getenv('HISTORY_MAX_PAGE_SIZE', 100))
+        self.max_pending = max_pending if max_pending is not None else int(os.getenv('HISTORY_MAX_PENDING', 64))
+        image_edge = image_edge if image_edge is not None else int(os.getenv('HISTORY_IMAGE_EDGE', 512))
+        # the library shows thumbnails, so store a downscaled copy rather than the full upload
+        self.thumbnailer = ImagePreprocessor(max_edge=image_edge, image_format='JPEG', quality=80)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self._connections = ThreadLocalSQLite(self.db_path) # WAL, so the library can read while the writer inserts
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+        db = self._db()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS diagnoses ("
+                "id TEXT PRIMARY KEY, created_at REAL NOT NULL, "
+                "species TEXT NOT NULL, species_key TEXT NOT NULL, disease TEXT NOT NULL, disease_key TEXT NOT NULL, "
+                "severity TEXT NOT NULL, plant_health TEXT NOT NULL, health_rank INTEGER NOT NULL, "
+                "confidence_value REAL NOT NULL, image_sha256 TEXT, report_id TEXT, "
+                "plant_type TEXT, prompt TEXT, analysis TEXT NOT NULL)"
+            )
+            # one index per filter, each ending in the default (date) sort so a filtered page is a range scan
+            for name, columns in (
+                ("created", "created_at, id"),
+                ("species", "species_key, created_at, id"),
+                ("disease", "disease_key, created_at, id"),
+                ("severity", "severity, created_at, id"),
+                ("health", "plant_health, created_at, id"),
+                ("health_rank", "health_rank, created_at, id"),
+                ("confidence", "confidence_value, created_at, id"),
+            ):
+                db.execute(f"CREATE INDEX IF NOT EXISTS idx_diagnoses_{name} ON diagnoses ({columns})")
+
+    def record(self, analysis: dict, image_data=None, prompt: str = '', plant_type: str = '',
+               report_id: str = None) -> str:
+        """
+        Queue a diagnosis to be written and return its history ID, or None if the write queue is
+        full; `image_data` must stay valid until the write finishes (uploads are read into
+        buffers that outlive the request)
+        """
+        history_id = uuid.uuid4().hex
+        with self._pending_lock:
+            full = self._pending >= self.max_pending
+            if not full:
+                self._pending += 1
+        if full:
+            HISTORY_WRITES.inc(result="dropped")
+            log.warning("history write queue full, diagnosis not recorded", extra={"pending_writes": self.max_pending})
+            return None
+        self._writer.submit(self._write, history_id, time.time(), analysis, image_data, prompt, plant_type, report_id)
+        return history_id
+
+    def import_plant(self, plant: dict) -> bool:
+        """
+        Write one plant saved by the old lowdb library (src/app/db/types.ts Plant) straight away,
+        keeping its date. IDs are derived from the lowdb ID, so importing twice adds nothing;
+        returns whether the plant was new
+        """
+        confidence, confidence_value = normalize_confidence(plant.get('confidence'))
+        analysis = {
+            'plant_species': plant.get('species') or 'Unknown',
+            'disease_detected': plant.get('diagnosis') or 'Unknown',
+            'confidence': confidence,
+            'confidence_value': confidence_value,
+            'severity': plant.get('severity'),
+            'plant_health': plant.get('plant_health'),
+            'recommendations': plant.get('treatments') or [],
+            'extra_info': '',
+        }
+        image_sha256 = None
+        image = plant.get('image') or ''
+        if image.startswith('data:') and ',' in image:
+            image_sha256 = self._put_image(base64.b64decode(image.split(',', 1)[1]))
+        history_id = hashlib.md5(f"lowdb:{plant.get('id')}".encode('utf-8')).hexdigest()
+        created_at = parse_time(plant.get('date')) or time.time()
+        return self._insert(history_id, created_at, analysis, image_sha256, plant.get('notes') or '', '', None,
+                            verb="INSERT OR IGNORE")
+
+    def flush(self, timeout: float = None):
+        """
+        Wait until every queued write has finished
+        """
+        self._writer.submit(lambda: None).result(timeout)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+
+    def get(self, history_id: str):
+        if not HISTORY_ID_PATTERN.match(history_id):
+            return None
+        row = self._db().execute(f"SELECT {self._COLUMNS} FROM diagnoses WHERE id = ?", (history_id,)).fetchone()
+        return self._view(row) if row is not None else None
+
+    def query(self, species: str = None, disease: str = None, severity: str = None, plant_health: str = None,
+              q: str = None, since: float = None, until: float = None, sort: str = 'date',
+              limit: int = None, cursor: str = None) -> dict:
+        """
+        Return one page of diagnoses as {"items": [...], "next_cursor": str or None}.
+
+        species/disease match case-insensitively; `q` is a prefix match on either. `since`/`until`
+        are epoch seconds. Pass the returned next_cursor back with the same filters to get the
+        next page. Raises ValueError for an unknown sort or a malformed cursor.
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort: {sort} (expected one of {', '.join(SORTS)})")
+        sort_column, direction = SORTS[sort]
+        limit = min(max(1, limit or self.page_size), self.max_page_size)
+
+        where, params = [], []
+        for column, value in (("species_key", _key(species)), ("disease_key", _key(disease)),
+                              ("severity", _key(severity)), ("plant_health", _key(plant_health))):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if q and q.strip():
+            # prefix ranges rather than LIKE, so each side can use its index
+            low = _key(q)
+            high = low + "\uffff"
+            where.append("((species_key >= ? AND species_key < ?) OR (disease_key >= ? AND disease_key < ?))")
+            params += [low, high, low, high]
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+
+        order_columns = ([sort_column] if sort_column else []) + ["created_at", "id"]
+        if cursor:
+            position = _decode_cursor(cursor, len(order_columns))
+            comparison = "<" if direction == "DESC" else ">"
+            where.append(f"({', '.join(order_columns)}) {comparison} ({', '.join('?' * len(order_columns))})")
+            params += position
+
+        sql = f"SELECT {self._COLUMNS} FROM diagnoses"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column in order_columns) + " LIMIT ?"
+        # fetch one extra row to know whether there's a next page without a COUNT
+        rows = self._db().execute(sql, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = _encode_cursor([last[self._COLUMN_INDEX[column]] for column in order_columns])
+        return {"items": [self._view(row) for row in rows], "next_cursor": next_cursor}
+
+    def image_path(self, image_sha256: str):
+        """
+        Return the path of a stored image, or None if the hash is malformed or unknown
+        """
+        if not IMAGE_SHA_PATTERN.match(image_sha256):
+            return None
+        path = self._blob_path(image_sha256)
+        return path if os.path.exists(path) else None
+
+    def stats(self) -> dict:
+        return {
+            "diagnoses": self._db().execute("SELECT COUNT(*) FROM diagnoses").fetchone()[0],
+            "pending_writes": self._pending,
+            "max_pending_writes": self.max_pending,
+        }
+
+    _COLUMNS = ("id, created_at, species, species_key, disease, disease_key, severity, plant_health, health_rank, "
+                "confidence_value, image_sha256, report_id, plant_type, prompt, analysis")
+    _COLUMN_INDEX = {column.strip(): index for index, column in enumerate(_COLUMNS.split(","))}
+
+    def _write(self, history_id: str, created_at: float, analysis: dict, image_data, prompt: str,
+               plant_type: str, report_id: str):
+        try:
+            image_sha256 = self._put_image(image_data) if image_data is not None else None
+            self._insert(history_id, created_at, analysis, image_sha256, prompt, plant_type, report_id)
+            HISTORY_WRITES.inc(result="ok")
+        except Exception as e:
+            HISTORY_WRITES.inc(result="error")
+            log.warning("failed to record diagnosis", extra={"history_id": history_id, "error": str(e)})
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+
+    def _insert(self, history_id: str, created_at: float, analysis: dict, image_sha256: str, prompt: str,
+                plant_type: str, report_id: str, verb: str = "INSERT") -> bool:
+        species = str(analysis.get('plant_species') or 'Unknown')
+        disease = str(analysis.get('disease_detected') or 'Unknown')
+        plant_health = _key(analysis.get('plant_health')) or 'unknown'
+        confidence_value = analysis.get('confidence_value')
+        db = self._db()
+        with db:
+            cursor = db.execute(
+                f"{verb} INTO diagnoses ({self._COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (history_id, created_at, species, _key(species), disease, _key(disease),
+                 _key(analysis.get('severity')) or 'unknown', plant_health, HEALTH_RANK.get(plant_health, 0),
+                 float(confidence_value) if confidence_value is not None else -1.0, # unknown sorts last
+                 image_sha256, report_id, plant_type, prompt, json.dumps(analysis, default=str))
+            )
+        return cursor.rowcount > 0
+
+    def _put_image(self, image_data):
+        try:
+            thumbnail, _ = self.thumbnailer.process(image_data)
+        except Exception as e:
+            log.warning("could not thumbnail image for history", extra={"error": str(e)})
+            return None
+        image_sha256 = hashlib.sha256(thumbnail).hexdigest()
+        path = self._blob_path(image_sha256)
+        if not os.path.exists(path): # same content, same name: already stored
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, thumbnail)
+        return image_sha256
+
+    def _blob_path(self, image_sha256: str) -> str:
+        # fan out by the first two hex digits so no directory grows too large
+        return os.path.join(self.blob_dir, image_sha256[:2], image_sha256)
+
+    def _db(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    @staticmethod
+    def _view(row) -> dict:
+        """
+        Shape a row like the frontend's Plant (src/app/db/types.ts), plus the full analysis
+        """
+        (history_id, created_at, species, _, disease, _, severity, plant_health, _, confidence_value,
+         image_sha256, report_id, plant_type, prompt, analysis) = row
+        analysis = json.loads(analysis)
+        return {
+            "id": history_id,
+            "species": species,
+            "image": f"/history/images/{image_sha256}" if image_sha256 else None,
+            "diagnosis": disease,
+            "treatments": analysis.get('recommendations', []),
+            "confidence": analysis.get('confidence', ''),
+            "confidence_value": confidence_value if confidence_value >= 0 else None,
+            "severity": severity,
+            "plant_health": plant_health,
+            "date": datetime.fromtimestamp(created_at, timezone.utc).isoformat(),
+            "notes": prompt or '',
+            "plant_type": plant_type or '',
+            "report_id": report_id,
+            "analysis": analysis,
+        }
+
+
+def parse_time(value: str):
+    """
+    Parse a `since`/`until` query value given as epoch seconds or an ISO 8601 date/time
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _key(value) -> str:
+    return " ".join(value.lower().split()) if isinstance(value, str) else ''
+
+
+def _encode_cursor(position: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str, length: int) -> list:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, list) or len(position) != length:
+        raise ValueError("Invalid cursor")
+    # only values this module encodes; anything else (objects, lists, booleans) can't be bound or compared
+    if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in position):
+        raise ValueError("Invalid cursor")
+    return position
@@ -0,0 +1,44 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from utils.uploads import BufferReader
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+class ImagePreprocessor:
+    """
+    In-process replacement for the img_compress service: downscales the image to a max edge,
+    drops EXIF/metadata, and re-encodes it as JPEG or WebP, returning raw bytes for the model.
+    """
+    def __init__(self, max_edge: int = None, image_format: str = None, quality: int = None):
+        self.max_edge = max_edge if max_edge is not None else int(os.getenv('IMAGE_MAX_EDGE', 1024))
+        self.image_format = (image_format or os.getenv('IMAGE_FORMAT', 'JPEG')).upper()
+        self.quality = quality if quality is not None else int(os.getenv('IMAGE_QUALITY', 80))
+        if self.image_format not in MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {self.image_format}")
+
+    def process(self, image_data) -> tuple:
+        """
+        Return (image_bytes, mime_type) for the preprocessed image; `image_data` is any bytes-like buffer
+        """
+        with Image.open(BufferReader(image_data)) as img:
+            # let the JPEG decoder downscale by a power of two while decoding, which is much cheaper than a full decode
+            img.draft('RGB', (self.max_edge, self.max_edge))
+
+            # bake the EXIF orientation into the pixels, since the metadata is dropped below
+            img = ImageOps.exif_transpose(img)
+
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+
+            output = BytesIO()
+            # no exif/icc arguments, so no metadata is written
+            img.save(output, format=self.image_format, quality=self.quality, optimize=self.image_format == 'JPEG')
+            return output.getvalue(), MIME_TYPES[self.image_format]
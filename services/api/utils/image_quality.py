@@ -0,0 +1,138 @@
+import os
+from typing import List, TypedDict
+
+import numpy as np
+from PIL import Image
+
+from utils.logging_config import get_logger
+from utils.metrics import QUALITY_REJECTIONS
+from utils.uploads import BufferReader
+
+log = get_logger("image_quality")
+
+# scores are computed on a copy downscaled to this edge, so they don't depend on the upload's resolution
+ANALYSIS_EDGE = 256
+
+# plant-coloured pixels in Pillow's HSV (every channel 0-255): yellow through blue-green (about
+# 40-170 degrees), with enough saturation and light to not be grey or shadow; soil and bark fall below
+PLANT_HUE_RANGE = (28, 120)
+PLANT_MIN_SATURATION = 40
+PLANT_MIN_VALUE = 40
+# red and purple foliage (red-leaf maples, coleus, purple basil): purple through red (about
+# 270-7 degrees). Held to a higher saturation, so brown soil and skin tones don't count
+RED_FOLIAGE_HUE_RANGES = ((0, 5), (190, 255))
+RED_FOLIAGE_MIN_SATURATION = 80
+
+
+class QualityIssue(TypedDict):
+    check: str # resolution, blur, exposure or plant
+    message: str # actionable, shown to the user
+    value: float
+    threshold: float
+
+
+class ImageQualityError(ValueError):
+    """
+    Raised when an upload fails the quality gate; `issues` lists the failed checks and how to fix them
+    """
+    def __init__(self, issues: List[QualityIssue], scores: dict):
+        self.issues = issues
+        self.scores = scores
+        super().__init__("Image rejected: " + " ".join(issue["message"] for issue in issues))
+
+
+class ImageQualityGate:
+    """
+    Cheap local checks that turn away unusable photos before any compression or Gemini call:
+    a minimum resolution, a Laplacian-variance blur score, exposure from the brightness
+    histogram, and the share of plant-coloured pixels. Takes a few milliseconds per image.
+    """
+    def __init__(self, enabled: bool = None, min_edge: int = None, min_sharpness: float = None,
+                 min_brightness: float = None, max_brightness: float = None, max_clipped: float = None,
+                 min_plant_ratio: float = None):
+        self.enabled = enabled if enabled is not None else os.getenv('QUALITY_GATE', 'true').lower() in ('1', 'true', 'yes', 'on')
+        self.min_edge = min_edge if min_edge is not None else int(os.getenv('QUALITY_MIN_EDGE', 256))
+        self.min_sharpness = min_sharpness if min_sharpness is not None else float(os.getenv('QUALITY_MIN_SHARPNESS', 40))
+        self.min_brightness = min_brightness if min_brightness is not None else float(os.getenv('QUALITY_MIN_BRIGHTNESS', 35))
+        self.max_brightness = max_brightness if max_brightness is not None else float(os.getenv('QUALITY_MAX_BRIGHTNESS', 220))
+        self.max_clipped = max_clipped if max_clipped is not None else float(os.getenv('QUALITY_MAX_CLIPPED', 0.4))
+        self.min_plant_ratio = min_plant_ratio if min_plant_ratio is not None else float(os.getenv('QUALITY_MIN_PLANT_RATIO', 0.05))
+
+    def check(self, image_data):
+        """
+        Raise ImageQualityError if the image fails any check. Images Pillow can't decode are let
+        through, as before, for the model to judge.
+        """
+        if not self.enabled:
+            return
+        try:
+            scores = self.score(image_data)
+        except Exception as e:
+            log.debug("quality gate skipped an undecodable image", extra={"error": str(e)})
+            return
+        issues = self.issues(scores)
+        if issues:
+            for issue in issues:
+                QUALITY_REJECTIONS.inc(check=issue["check"])
+            raise ImageQualityError(issues, scores)
+
+    def score(self, image_data) -> dict:
+        """
+        Return the raw scores for an image: width, height, sharpness (Laplacian variance),
+        brightness (mean, 0-255), dark/bright fractions (near-black/near-white pixels) and plant_ratio
+        """
+        with Image.open(BufferReader(image_data)) as img:
+            width, height = img.size
+            # let the JPEG decoder downscale while decoding; the gate never needs full resolution
+            img.draft('RGB', (ANALYSIS_EDGE, ANALYSIS_EDGE))
+            rgb = img.convert('RGB')
+        rgb.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE), Image.BILINEAR)
+
+        gray = np.asarray(rgb.convert('L'))
+        luma = gray.astype(np.float32)
+        # 4-neighbour Laplacian via shifted views; a sharp photo has strong, varied edges
+        laplacian = luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:] - 4 * luma[1:-1, 1:-1]
+        histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+
+        hsv = np.asarray(rgb.convert('HSV'))
+        hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        green = (hue >= PLANT_HUE_RANGE[0]) & (hue <= PLANT_HUE_RANGE[1]) & (saturation >= PLANT_MIN_SATURATION)
+        red = (((hue <= RED_FOLIAGE_HUE_RANGES[0][1]) | (hue >= RED_FOLIAGE_HUE_RANGES[1][0]))
+               & (saturation >= RED_FOLIAGE_MIN_SATURATION))
+        plant = (green | red) & (value >= PLANT_MIN_VALUE)
+
+        return {
+            "width": width,
+            "height": height,
+            "sharpness": float(laplacian.var()) if laplacian.size else 0.0,
+            "brightness": float(luma.mean()),
+            "dark_fraction": float(histogram[:16].sum()),
+            "bright_fraction": float(histogram[240:].sum()),
+            "plant_ratio": float(plant.mean()),
+        }
+
+    def issues(self, scores: dict) -> List[QualityIssue]:
+        issues = []
+        short_edge = min(scores["width"], scores["height"])
+        if short_edge < self.min_edge:
+            issues.append(QualityIssue(
+                check="resolution", value=short_edge, threshold=self.min_edge,
+                message=f"The photo is only {scores['width']}x{scores['height']} pixels; use one at least {self.min_edge} pixels on its shorter side."))
+        if scores["brightness"] < self.min_brightness or scores["dark_fraction"] > self.max_clipped:
+            issues.append(QualityIssue(
+                check="exposure", value=scores["brightness"], threshold=self.min_brightness,
+                message="The photo is too dark; retake it in daylight or with more light on the plant."))
+        elif scores["brightness"] > self.max_brightness or scores["bright_fraction"] > self.max_clipped:
+            issues.append(QualityIssue(
+                check="exposure", value=scores["brightness"], threshold=self.max_brightness,
+                message="The photo is overexposed; avoid direct sun or flash glare on the leaves."))
+        elif scores["sharpness"] < self.min_sharpness:
+            # badly exposed photos have little contrast, so only judge blur once exposure is fine
+            issues.append(QualityIssue(
+                check="blur", value=round(scores["sharpness"], 1), threshold=self.min_sharpness,
+                message="The photo is blurry; hold the camera steady and tap to focus on the affected leaves."))
+        if scores["plant_ratio"] < self.min_plant_ratio:
+            issues.append(QualityIssue(
+                check="plant", value=round(scores["plant_ratio"], 3), threshold=self.min_plant_ratio,
+                message="No plant is visible; fill the frame with the affected leaves or stem."))
+        return issues
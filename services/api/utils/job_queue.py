@@ -0,0 +1,283 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from utils.logging_config import get_logger
+from utils.storage import ThreadLocalSQLite
+from utils.upstream import get_http_session, get_upstream
+
+log = get_logger("job_queue")
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue is at its max depth
+    """
+    def __init__(self, depth: int, retry_after: float):
+        self.depth = depth
+        self.retry_after = retry_after
+        super().__init__(f"Job queue is full ({depth} jobs pending)")
+
+
+class InvalidWebhookError(ValueError):
+    """
+    Raised when a job is submitted with a webhook URL that isn't http(s) or whose host isn't allowlisted
+    """
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a pool of worker threads.
+
+    Jobs are rows in a local SQLite file, so every worker process pointed at the same file
+    shares one queue, and queued work survives a restart. Jobs left 'running' by a worker
+    that died are put back in the queue once their lease runs out.
+    """
+    def __init__(self, handler, db_path: str = None, workers: int = None, max_depth: int = None,
+                 lease_seconds: float = None, retention_seconds: float = None):
+        self.handler = handler # (params: dict, image_data: bytes) -> result dict; raise to fail the job
+        self.db_path = db_path or os.getenv('JOB_QUEUE_DB', os.path.join(tempfile.gettempdir(), 'doctor_plant_jobs.db'))
+        self.workers = workers if workers is not None else int(os.getenv('JOB_WORKERS', 4))
+        self.max_depth = max_depth if max_depth is not None else int(os.getenv('JOB_QUEUE_MAX_DEPTH', 100))
+        self.lease_seconds = lease_seconds if lease_seconds is not None else float(os.getenv('JOB_LEASE_SECONDS', 300))
+        self.retention_seconds = retention_seconds if retention_seconds is not None else float(os.getenv('JOB_RETENTION_SECONDS', 24 * 60 * 60))
+        # hosts webhooks may be sent to; '*.example.com' also matches subdomains. Empty disables webhooks
+        self.webhook_allowed_hosts = [host.strip().lower() for host in os.getenv('JOB_WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()]
+        self.webhook = get_upstream('webhook')
+
+        # isolation_level=None so transactions are explicit (BEGIN IMMEDIATE)
+        self._connections = ThreadLocalSQLite(self.db_path, isolation_level=None)
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._last_cleanup = 0.0
+        self._leases = {} # job_id -> lease_id of the jobs this process is running, renewed by the heartbeat
+        self._leases_lock = threading.Lock()
+
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, payload BLOB, "
+            "result TEXT, error TEXT, webhook_url TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, lease_id TEXT)"
+        )
+        if 'lease_id' not in {column[1] for column in db.execute("PRAGMA table_info(jobs)")}:
+            db.execute("ALTER TABLE jobs ADD COLUMN lease_id TEXT") # queue files from before leases were owned
+        db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+        db.commit()
+
+    def start(self):
+        """
+        Start the worker threads; call once per process (after forking, in multi-process servers)
+        """
+        if self._threads or self.workers <= 0:
+            return
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def stop(self, timeout: float = None):
+        """
+        Stop claiming new jobs and wait up to `timeout` seconds for running ones to finish;
+        jobs still running after that are requeued by another worker once their lease expires
+        """
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+    def submit(self, image_data: bytes, params: dict, webhook_url: str = None) -> str:
+        if webhook_url:
+            self.check_webhook_url(webhook_url)
+        db = self._db()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        with db:
+            db.execute("BEGIN IMMEDIATE") # serialize the depth check with other submitters
+            depth = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if depth >= self.max_depth:
+                raise QueueFullError(depth, self._estimate_retry_after(depth))
+            db.execute(
+                "INSERT INTO jobs (id, status, params, payload, webhook_url, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(params), sqlite3.Binary(image_data), webhook_url, now, now)
+            )
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str):
+        row = self._db().execute(
+            "SELECT id, status, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._view(row)
+
+    def stats(self) -> dict:
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: count for status, count in rows}
+        return {
+            "queued": counts.get('queued', 0),
+            "running": counts.get('running', 0),
+            "done": counts.get('done', 0),
+            "failed": counts.get('failed', 0),
+            "max_depth": self.max_depth,
+            "workers": len(self._threads),
+        }
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                self._cleanup()
+                with self._wakeup:
+                    # other processes can enqueue too, so poll as well as waiting for a local notify
+                    self._wakeup.wait(timeout=1.0)
+                continue
+            self._run(*job)
+
+    def _claim(self):
+        """
+        Atomically move the oldest queued job (or one whose lease expired) to running, under a
+        new lease ID that only this worker holds
+        """
+        db = self._db()
+        now = time.time()
+        lease_id = uuid.uuid4().hex
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id, params, payload, webhook_url FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND updated_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - self.lease_seconds,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', updated_at = ?, lease_id = ? WHERE id = ?", (now, lease_id, row[0]))
+        job_id, params, payload, webhook_url = row
+        return job_id, lease_id, json.loads(params), bytes(payload), webhook_url
+
+    def _run(self, job_id: str, lease_id: str, params: dict, image_data: bytes, webhook_url: str):
+        with self._leases_lock:
+            self._leases[job_id] = lease_id
+        try:
+            try:
+                result = self.handler(params, image_data)
+                status, result_json, error = 'done', json.dumps(result, default=str), None
+            except Exception as e:
+                log.warning("job failed", extra={"job_id": job_id, "error": str(e)})
+                status, result_json, error = 'failed', None, str(e)
+
+            db = self._db()
+            with db:
+                # drop the image once the job is finished; only the result is kept. Only the
+                # lease holder may finish the job, so a requeued copy can't be finished twice
+                finished = db.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, updated_at = ? "
+                    "WHERE id = ? AND lease_id = ? AND status = 'running'",
+                    (status, result_json, error, time.time(), job_id, lease_id)
+                ).rowcount
+        finally:
+            with self._leases_lock:
+                self._leases.pop(job_id, None)
+
+        if not finished:
+            log.warning("job lease lost before it finished; result dropped", extra={"job_id": job_id})
+            return
+        if webhook_url:
+            self._send_webhook(webhook_url, self.get(job_id))
+
+    def _heartbeat(self):
+        """
+        Renew the leases of running jobs every third of the lease, however long a job takes
+        (admission waits, model retries), so only a worker that died loses its jobs
+        """
+        while not self._stopping.wait(self.lease_seconds / 3):
+            with self._leases_lock:
+                leases = list(self._leases.items())
+            if not leases:
+                continue
+            try:
+                db = self._db()
+                now = time.time()
+                with db:
+                    db.executemany(
+                        "UPDATE jobs SET updated_at = ? WHERE id = ? AND lease_id = ? AND status = 'running'",
+                        [(now, job_id, lease_id) for job_id, lease_id in leases]
+                    )
+            except sqlite3.Error as e:
+                log.warning("failed to renew job leases", extra={"jobs": len(leases), "error": str(e)})
+
+    def check_webhook_url(self, webhook_url: str):
+        """
+        Raise InvalidWebhookError unless the URL is http(s) and its host is on JOB_WEBHOOK_ALLOWED_HOSTS,
+        so a job can't be used to make the server POST to internal addresses
+        """
+        try:
+            url = urlsplit(webhook_url)
+            host = (url.hostname or '').lower()
+        except ValueError:
+            raise InvalidWebhookError(f"Invalid webhook URL: {webhook_url}")
+        if url.scheme not in ('http', 'https') or not host:
+            raise InvalidWebhookError("Webhook URL must be an http(s) URL")
+        for allowed in self.webhook_allowed_hosts:
+            if host == allowed or (allowed.startswith('*.') and host.endswith(allowed[1:])):
+                return
+        raise InvalidWebhookError(f"Webhook host not allowed: {host}")
+
+    def _send_webhook(self, webhook_url: str, job: dict):
+        try:
+            self.check_webhook_url(webhook_url) # the allowlist may have changed since the job was queued
+            self.webhook.call_sync(self._post_webhook, webhook_url, job)
+        except Exception as e:
+            log.warning("webhook delivery failed", extra={"job_id": job['job_id'], "webhook_url": webhook_url, "error": str(e)})
+
+    @staticmethod
+    def _post_webhook(webhook_url: str, job: dict):
+        # don't follow redirects, they could lead off the allowlist
+        response = get_http_session().post(webhook_url, json=job, timeout=10, allow_redirects=False)
+        response.raise_for_status()
+
+    def _cleanup(self):
+        """
+        Delete finished jobs past their retention, at most once a minute
+        """
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (now - self.retention_seconds,))
+
+    def _estimate_retry_after(self, depth: int) -> float:
+        # rough guess: the backlog drains at ~one job per worker every few seconds
+        return max(1.0, depth / max(1, self.workers) * 5.0)
+
+    def _db(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    @staticmethod
+    def _view(row) -> dict:
+        job_id, status, result, error, created_at, updated_at = row
+        job = {"job_id": job_id, "status": status, "created_at": created_at, "updated_at": updated_at}
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
@@ -0,0 +1,50 @@
+import time
+
+from utils.metrics import STARTUP_SECONDS
+
+
+class Lifecycle:
+    """
+    Startup and shutdown state of one worker process.
+
+    Startup phases are timed from `started_at` (the fork, under the production server, or the
+    app import otherwise) until the worker is warmed up and ready. Once draining starts the
+    worker reports not-ready, so load balancers stop sending it traffic while it finishes work.
+    """
+    def __init__(self, started_at: float = None):
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.timings = {}
+        self.ready = False
+        self.draining = False
+        self._phase_started = self.started_at
+
+    def restart_clock(self, started_at: float):
+        """
+        Time startup from `started_at` instead, e.g. the fork, which happens before the app is imported
+        """
+        self.started_at = started_at
+        self._phase_started = started_at
+
+    def phase_done(self, phase: str):
+        """
+        Record the time since the previous phase (or since start) as `phase`
+        """
+        now = time.monotonic()
+        self.timings[phase] = now - self._phase_started
+        self._phase_started = now
+        STARTUP_SECONDS.set(self.timings[phase], phase=phase)
+
+    def mark_ready(self):
+        self.timings["time_to_ready"] = time.monotonic() - self.started_at
+        STARTUP_SECONDS.set(self.timings["time_to_ready"], phase="time_to_ready")
+        self.ready = True
+
+    def start_draining(self):
+        self.draining = True
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready and not self.draining,
+            "draining": self.draining,
+            "startup_seconds": {phase: round(seconds, 3) for phase, seconds in self.timings.items()},
+        }
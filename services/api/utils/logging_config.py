@@ -0,0 +1,47 @@
+import json
+import logging
+import os
+import time
+
+# attributes every LogRecord has; anything else on a record came from `extra=` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, and any `extra=` fields
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """
+    Configure the service's loggers from LOG_LEVEL (default INFO) and LOG_FORMAT ('json' or 'text').
+    Per-request detail is logged at DEBUG, so it costs nothing on the hot path unless LOG_LEVEL=DEBUG.
+    """
+    handler = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    logger = logging.getLogger("doctor_plant")
+    logger.handlers[:] = [handler]
+    logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"doctor_plant.{name}")
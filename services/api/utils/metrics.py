@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets in seconds, from a cache hit up to a slow vision call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = list(self._values.items())
+        lines.extend(self._render_values(items))
+        return lines
+
+    def _render_values(self, items: list) -> list:
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in items]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket (non-cumulative) counts, sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_values(self, items: list) -> list:
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds every metric and renders them in the Prometheus text exposition format.
+    Collectors are callables run at scrape time that refresh gauges from components that keep their own stats.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, description: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, labelnames: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, description, labelnames))
+
+    def histogram(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, description, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                pass # a broken collector must not take down the scrape
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+REGISTRY = Registry()
+
+# analyze pipeline metrics: analyze_plant -> ai_response -> analyze_image -> report rendering
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Request latency by endpoint", ("endpoint",))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being handled, by endpoint", ("endpoint",))
+STAGE_LATENCY = REGISTRY.histogram(
+    "analyze_stage_duration_seconds",
+    "Latency of each analyze pipeline stage (upload_read, cache_lookup, quality_gate, preprocess, base64_decode, gemini_call, json_parse, pdf_render)",
+    ("stage",))
+ANALYZE_ERRORS = REGISTRY.counter(
+    "analyze_errors_total",
+    "Analyze pipeline errors by category (json_decode, json_repaired, vision_error, compression_fallback, preprocess_fallback, service_error, escalation_failed)",
+    ("category",))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "upstream_calls_in_flight", "Upstream calls currently waiting on a response", ("upstream",))
+VISION_TIER_LATENCY = REGISTRY.histogram(
+    "vision_tier_duration_seconds", "Latency of each vision model call, by model tier", ("tier",))
+VISION_DIAGNOSES = REGISTRY.counter(
+    "vision_diagnoses_total", "Diagnoses returned, by the model tier that answered", ("tier",))
+VISION_ESCALATIONS = REGISTRY.counter(
+    "vision_escalations_total", "Diagnoses passed up to the next model tier, by tier and reason (low_confidence, severity, parse_error, error)",
+    ("tier", "reason"))
+STARTUP_SECONDS = REGISTRY.gauge(
+    "startup_seconds", "Time spent in each startup phase of this worker process (init, warmup, time_to_ready)", ("phase",))
+HISTORY_WRITES = REGISTRY.counter(
+    "history_writes_total", "Diagnoses written to the history store, by result (ok, error, dropped)", ("result",))
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "admission_decisions_total", "Admission decisions by lane and result (admitted, rate_limited, over_capacity)", ("lane", "result"))
+QUALITY_REJECTIONS = REGISTRY.counter(
+    "image_quality_rejections_total", "Uploads turned away by the image quality gate, by failed check (resolution, blur, exposure, plant)", ("check",))
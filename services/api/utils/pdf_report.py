@@ -0,0 +1,153 @@
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from utils.metrics import STAGE_LATENCY
+
+
+# page streams are only ever read by PDF viewers, so skip the pure-Python ASCII85 armor and keep them binary + zlib
+rl_config.useA85 = 0
+
+# machine-readable fields kept for sorting and filtering; the report shows their display form instead
+NON_DISPLAY_FIELDS = {"confidence_value"}
+
+
+class ReportTemplate:
+    """
+    Static page furniture and layout for the diagnostic reports, built once at import and shared by every render
+    """
+    def __init__(self):
+        self.page_size = letter
+        self.page_width, self.page_height = letter
+        self.left_margin = 50
+        self.list_indent = 70
+        self.right_margin = 50
+        self.top = 750
+        self.bottom = 50
+
+        self.title_font = ("Helvetica-Bold", 16)
+        self.heading_font = ("Helvetica-Bold", 13)
+        self.meta_font = ("Helvetica", 10)
+        self.body_font = ("Helvetica", 12)
+        self.line_height = 15
+        self.field_gap = 5
+
+        self.title = "Plant Disease Diagnostic Report"
+        self.batch_title = "Plant Disease Diagnostic Report (Batch)"
+        self.bullet = "• "
+        self.bullet_width = stringWidth(self.bullet, *self.body_font)
+
+        self.body_width = self.page_width - self.left_margin - self.right_margin
+        self.list_width = self.page_width - self.list_indent - self.right_margin - self.bullet_width
+
+
+TEMPLATE = ReportTemplate()
+
+
+@lru_cache(maxsize=4096)
+def _wrap(text: str, font_name: str, font_size: int, max_width: float) -> tuple:
+    """Width-aware line wrapping; memoized since recommendations and labels repeat across reports"""
+    return tuple(simpleSplit(text, font_name, font_size, max_width)) or ("",)
+
+
+class _PageWriter:
+    """Draws lines top to bottom, breaking to a new page when it runs out of room"""
+    def __init__(self, c: canvas.Canvas, template: ReportTemplate):
+        self.c = c
+        self.t = template
+        self.y = template.top
+        self.font = None
+
+    def ensure_room(self, height: float):
+        if self.y - height < self.t.bottom:
+            self.c.showPage()
+            self.y = self.t.top
+            self.font = None # showPage resets the graphics state
+
+    def text(self, x: float, text: str, font: tuple, height: float = None):
+        self.ensure_room(0)
+        if font != self.font:
+            self.c.setFont(*font)
+            self.font = font
+        self.c.drawString(x, self.y, text)
+        self.y -= height if height is not None else self.t.line_height
+
+    def wrapped(self, x: float, text: str, max_width: float, first_prefix: str = "", indent: float = 0):
+        lines = _wrap(text, self.t.body_font[0], self.t.body_font[1], max_width)
+        for index, line in enumerate(lines):
+            if index == 0:
+                self.text(x, first_prefix + line, self.t.body_font)
+            else:
+                self.text(x + indent, line, self.t.body_font)
+
+    def header(self, title: str, generated_at: float, extra_lines: tuple = ()):
+        self.text(self.t.left_margin, title, self.t.title_font, 20)
+        self.text(self.t.left_margin, f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(generated_at))}", self.t.meta_font)
+        for line in extra_lines:
+            self.text(self.t.left_margin, line, self.t.meta_font)
+        self.y -= 15
+
+    def analysis(self, analysis_results: dict):
+        t = self.t
+        for key, value in analysis_results.items():
+            if key in NON_DISPLAY_FIELDS:
+                continue
+            key_str = str(key).replace("_", " ").title()
+            if isinstance(value, list):
+                self.text(t.left_margin, f"{key_str}:", t.body_font)
+                for item in value:
+                    self.wrapped(t.list_indent, str(item), t.list_width, first_prefix=t.bullet, indent=t.bullet_width)
+            else:
+                self.wrapped(t.left_margin, f"{key_str}: {value}", t.body_width)
+            self.y -= t.field_gap
+
+
+def _new_canvas(buffer: BytesIO, template: ReportTemplate) -> canvas.Canvas:
+    return canvas.Canvas(buffer, pagesize=template.page_size, pageCompression=1,
+                         initialFontName=template.body_font[0], initialFontSize=template.body_font[1])
+
+
+def generate_pdf_report(analysis_results: dict, generated_at: float = None) -> BytesIO:
+    """Generate a PDF report from the AI model's analysis results."""
+    buffer = BytesIO()
+    c = _new_canvas(buffer, TEMPLATE)
+    writer = _PageWriter(c, TEMPLATE)
+    writer.header(TEMPLATE.title, generated_at or time.time())
+    writer.analysis(analysis_results)
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def generate_batch_pdf_report(named_results: list, generated_at: float = None) -> BytesIO:
+    """Generate one PDF report with a section per (filename, analysis results) pair of a batch."""
+    buffer = BytesIO()
+    c = _new_canvas(buffer, TEMPLATE)
+    writer = _PageWriter(c, TEMPLATE)
+    writer.header(TEMPLATE.batch_title, generated_at or time.time(), (f"Images analyzed: {len(named_results)}",))
+    for filename, analysis_results in named_results:
+        writer.ensure_room(100) # start an image on a fresh page if there's little room left
+        writer.text(TEMPLATE.left_margin, str(filename), TEMPLATE.heading_font, 22)
+        writer.analysis(analysis_results)
+        writer.y -= 10
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def render_report(payload: dict) -> bytes:
+    """
+    Render a deferred report payload stored by the ReportStore:
+    {"kind": "single", "analysis": {...}} or {"kind": "batch", "results": [[filename, analysis], ...]}
+    """
+    generated_at = payload.get("generated_at")
+    with STAGE_LATENCY.time(stage="pdf_render"):
+        if payload.get("kind") == "batch":
+            return generate_batch_pdf_report(payload["results"], generated_at).getvalue()
+        return generate_pdf_report(payload["analysis"], generated_at).getvalue()
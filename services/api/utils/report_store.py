@@ -0,0 +1,224 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from utils.logging_config import get_logger
+from utils.storage import write_atomic
+
+log = get_logger("report_store")
+
+REPORT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ReportStore:
+    """
+    Bounded, expiring store for generated PDF reports.
+
+    Reports get a random unique ID and live in an in-memory LRU tier capped by a byte budget
+    and a TTL. When REPORT_STORE_DIR is set, every report is also written to that directory,
+    so any worker process pointed at the same directory can serve it, and reports evicted
+    from memory are still served from disk until they expire.
+
+    Reports are stored deferred: only the JSON payload is kept, and the PDF is rendered by
+    `renderer` on a background pool the first time it's opened, then memoized.
+    """
+    def __init__(self, max_bytes: int = None, ttl_seconds: float = None, spill_dir: str = None,
+                 renderer=None, render_workers: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('REPORT_STORE_MAX_BYTES', 64 * 1024 * 1024))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('REPORT_STORE_TTL', 60 * 60))
+        self.spill_dir = spill_dir if spill_dir is not None else os.getenv('REPORT_STORE_DIR', '')
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        self.renderer = renderer
+        render_workers = render_workers if render_workers is not None else int(os.getenv('REPORT_RENDER_WORKERS', 2))
+        self._render_pool = ThreadPoolExecutor(max_workers=render_workers, thread_name_prefix="pdf-render")
+        self._renders = {} # report_id -> Future, so concurrent downloads share one render
+
+        # report_id -> (expires_at, size, pdf_bytes or None, payload or None)
+        self._entries = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.renders = 0
+
+    def put_deferred(self, payload: dict) -> str:
+        """
+        Store a report payload to be rendered on first download and return its ID
+        """
+        report_id = uuid.uuid4().hex
+        payload_json = json.dumps(payload, default=str)
+        if self.spill_dir:
+            write_atomic(self._payload_path(report_id), payload_json.encode('utf-8'))
+        self._memory_put(report_id, time.time() + self.ttl_seconds, None, payload, len(payload_json))
+        self._maybe_sweep_disk()
+        return report_id
+
+    def open(self, report_id: str):
+        """
+        Return a readable file object for the report, or None if it's unknown or expired
+        """
+        if not REPORT_ID_PATTERN.match(report_id or ''):
+            return None
+
+        now = time.time()
+        payload = None
+        with self._lock:
+            entry = self._entries.get(report_id)
+            if entry is not None:
+                expires_at, _, pdf_bytes, payload = entry
+                if expires_at <= now:
+                    self._remove_locked(report_id)
+                    self.expirations += 1
+                    payload = None
+                else:
+                    self._entries.move_to_end(report_id)
+                    self.hits += 1
+                    if pdf_bytes is not None:
+                        return BytesIO(pdf_bytes)
+
+        if payload is not None:
+            return BytesIO(self._render(report_id, payload))
+
+        report_file = self._open_file(report_id, now)
+        with self._lock:
+            if report_file is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        return report_file
+
+    def delete(self, report_id: str):
+        with self._lock:
+            if report_id in self._entries:
+                self._remove_locked(report_id)
+        if self.spill_dir and REPORT_ID_PATTERN.match(report_id or ''):
+            for path in (self._file_path(report_id), self._payload_path(report_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "renders": self.renders,
+                "disk": bool(self.spill_dir),
+            }
+
+    def _render(self, report_id: str, payload: dict) -> bytes:
+        """
+        Render a deferred report on the render pool, sharing the render between concurrent callers,
+        and memoize the PDF in place of the payload
+        """
+        with self._lock:
+            future = self._renders.get(report_id)
+            if future is None:
+                future = self._render_pool.submit(self.renderer, payload)
+                self._renders[report_id] = future
+                self.renders += 1
+
+        try:
+            pdf_bytes = future.result()
+        finally:
+            with self._lock:
+                self._renders.pop(report_id, None)
+
+        with self._lock:
+            entry = self._entries.get(report_id)
+            if entry is not None and entry[2] is None:
+                self._remove_locked(report_id)
+                self._entries[report_id] = (entry[0], len(pdf_bytes), pdf_bytes, None)
+                self._current_bytes += len(pdf_bytes)
+                self._evict_locked(time.time())
+
+        if self.spill_dir:
+            write_atomic(self._file_path(report_id), pdf_bytes)
+            try:
+                os.remove(self._payload_path(report_id))
+            except FileNotFoundError:
+                pass
+        return pdf_bytes
+
+    def _memory_put(self, report_id: str, expires_at: float, pdf_bytes, payload, size: int):
+        with self._lock:
+            if size <= self.max_bytes:
+                self._entries[report_id] = (expires_at, size, pdf_bytes, payload)
+                self._current_bytes += size
+            self._evict_locked(time.time())
+
+    def _evict_locked(self, now: float):
+        # drop expired reports first, then least recently used ones until we're under budget
+        for report_id in [key for key, entry in self._entries.items() if entry[0] <= now]:
+            self._remove_locked(report_id)
+            self.expirations += 1
+        while self._current_bytes > self.max_bytes and self._entries:
+            self._remove_locked(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove_locked(self, report_id: str):
+        _, size, _, _ = self._entries.pop(report_id)
+        self._current_bytes -= size
+
+    def _file_path(self, report_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{report_id}.pdf")
+
+    def _payload_path(self, report_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{report_id}.json")
+
+    def _open_file(self, report_id: str, now: float):
+        if not self.spill_dir:
+            return None
+        for path in (self._file_path(report_id), self._payload_path(report_id)):
+            try:
+                if os.path.getmtime(path) + self.ttl_seconds <= now:
+                    os.remove(path)
+                    continue
+                if path.endswith('.pdf'):
+                    return open(path, 'rb')
+                # another worker stored this report deferred; render it here
+                with open(path, 'rb') as f:
+                    payload = json.loads(f.read())
+                return BytesIO(self._render(report_id, payload))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return None
+
+    def _maybe_sweep_disk(self):
+        """
+        Remove expired report files, at most once a minute
+        """
+        now = time.time()
+        if not self.spill_dir or now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        try:
+            with os.scandir(self.spill_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(('.pdf', '.json')) and entry.stat().st_mtime + self.ttl_seconds <= now:
+                        try:
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            pass
+        except OSError as e:
+            log.warning("error sweeping report store", extra={"error": str(e)})
@@ -0,0 +1,241 @@
+import json
+import re
+from typing import List, Optional, TypedDict
+
+from google.genai import types
+
+try:
+    import orjson # optional, several times faster than json for these payloads
+except ImportError:
+    orjson = None
+
+SEVERITIES = ("low", "medium", "high")
+PLANT_HEALTH = ("excellent", "good", "fair", "poor", "critical")
+
+SEVERITY_SYNONYMS = {
+    "none": "low", "minimal": "low", "mild": "low", "minor": "low", "slight": "low",
+    "moderate": "medium", "medium-high": "high", "severe": "high", "critical": "high", "very high": "high",
+}
+PLANT_HEALTH_SYNONYMS = {
+    "very good": "excellent", "healthy": "good", "moderate": "fair", "average": "fair",
+    "bad": "poor", "unhealthy": "poor", "very poor": "critical", "dying": "critical", "dead": "critical",
+}
+
+NUMBER_PATTERN = re.compile(r"[-+]?\d+(?:\.\d+)?")
+# JSON tokens after optional whitespace: a string (group 2 is its closing quote, empty if the text
+# ends first), punctuation, or a bare literal
+TOKEN_PATTERN = re.compile(r'\s*("(?:[^"\\]|\\.)*("?)|[{}\[\],:]|[^\s{}\[\],:"]+)', re.S)
+
+
+class PlantAnalysis(TypedDict):
+    """
+    Diagnosis returned by /analyze; mirrors the Plant interface in src/app/db/types.ts
+    """
+    plant_species: str
+    disease_detected: str
+    confidence: str # normalized to e.g. "85%", as the frontend stores it
+    confidence_value: Optional[float] # the same confidence as a number from 0 to 100
+    severity: str # one of SEVERITIES, or "Unknown"
+    recommendations: List[str]
+    plant_health: str # one of PLANT_HEALTH, or "Unknown"
+    extra_info: str
+
+
+# structured output schema sent with the request, so Gemini returns bare JSON in this shape
+ANALYSIS_RESPONSE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "plant_species": types.Schema(type=types.Type.STRING),
+        "disease_detected": types.Schema(type=types.Type.STRING, description="disease name or 'Healthy'"),
+        "confidence": types.Schema(type=types.Type.STRING, description="percentage like '85%'"),
+        "severity": types.Schema(type=types.Type.STRING, enum=list(SEVERITIES)),
+        "recommendations": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
+        "plant_health": types.Schema(type=types.Type.STRING, enum=list(PLANT_HEALTH)),
+        "extra_info": types.Schema(type=types.Type.STRING, description="extra information about the plant, disease, or health"),
+    },
+    required=["plant_species", "disease_detected", "confidence", "severity", "recommendations", "plant_health", "extra_info"],
+    property_ordering=["plant_species", "disease_detected", "confidence", "severity", "recommendations", "plant_health", "extra_info"],
+)
+
+
+class ResponseParseError(ValueError):
+    """
+    Raised when no usable analysis object can be recovered from the model's text
+    """
+    def __init__(self, message: str, text: str):
+        self.text = text
+        super().__init__(message)
+
+
+def loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def parse_analysis(text: str) -> tuple:
+    """
+    Parse the model's response into a normalized PlantAnalysis.
+
+    Returns (analysis, repaired), where `repaired` says whether the text needed more than a plain
+    JSON parse (prose or code fences around it, trailing commas, or truncated output).
+    """
+    repaired = False
+    try:
+        data = loads(text)
+    except ValueError:
+        extracted = extract_json_object(text)
+        if extracted is None:
+            raise ResponseParseError("no JSON object in response", text)
+        try:
+            data = loads(extracted)
+        except ValueError as e:
+            raise ResponseParseError(f"unrecoverable JSON: {e}", text)
+        repaired = True
+
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        data = data[0] # some responses wrap the object in a one-element array
+    if not isinstance(data, dict):
+        raise ResponseParseError(f"expected a JSON object, got {type(data).__name__}", text)
+    return normalize_analysis(data, text), repaired
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Return the first JSON object in `text` as a strict JSON string, or None if there isn't one.
+
+    Tokenizes once from the first '{', tracking nesting, so braces inside strings and surrounding
+    prose or code fences don't matter. Trailing commas are dropped as they're seen, and if the text
+    ends before the object closes, it's cut back to the last complete value and the open
+    containers are closed.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    out = []
+    stack = [] # open containers: '{' or '['
+    expect_key = False # inside an object, waiting for a key
+    pending_comma = False
+    after_literal = False # a number/true/false/null was just emitted; complete once a delimiter follows
+    safe_length = 0 # out length at the last point where the object could be closed cleanly
+    safe_stack = ()
+
+    for match in TOKEN_PATTERN.finditer(text, start):
+        token = match.group(1)
+        first = token[0]
+
+        if after_literal:
+            after_literal = False
+            safe_length, safe_stack = len(out), tuple(stack)
+        if first == ",":
+            pending_comma = True
+            continue
+        if pending_comma:
+            pending_comma = False
+            if first not in "}]": # a comma right before a closer is a trailing comma; drop it
+                out.append(",")
+                expect_key = stack[-1] == "{"
+
+        if first == '"':
+            if not match.group(2):
+                break # the text ends inside this string
+            is_key = expect_key and stack[-1] == "{"
+            expect_key = False
+            out.append(token)
+            if not is_key:
+                safe_length, safe_stack = len(out), tuple(stack)
+        elif first == ":":
+            out.append(token)
+        elif first in "{[":
+            stack.append(first)
+            expect_key = first == "{"
+            out.append(token)
+            safe_length, safe_stack = len(out), tuple(stack)
+        elif first in "}]":
+            stack.pop()
+            out.append(token)
+            expect_key = False
+            if not stack:
+                return "".join(out)
+            safe_length, safe_stack = len(out), tuple(stack)
+        else:
+            out.append(token)
+            after_literal = True
+
+    # the text ended inside the object; keep what was complete and close it
+    closers = "".join("}" if opener == "{" else "]" for opener in reversed(safe_stack))
+    return "".join(out[:safe_length]) + closers
+
+
+def normalize_analysis(data: dict, text: str = "") -> PlantAnalysis:
+    disease = data.get("disease_detected")
+    if not isinstance(disease, str) or not disease.strip():
+        raise ResponseParseError("missing disease_detected", text)
+
+    confidence, confidence_value = normalize_confidence(data.get("confidence"))
+    recommendations = data.get("recommendations") or []
+    if isinstance(recommendations, str):
+        recommendations = [recommendations]
+
+    return PlantAnalysis(
+        plant_species=_text(data.get("plant_species"), "Unknown"),
+        disease_detected=disease.strip(),
+        confidence=confidence,
+        confidence_value=confidence_value,
+        severity=_choice(data.get("severity"), SEVERITIES, SEVERITY_SYNONYMS),
+        recommendations=[str(item) for item in recommendations if item not in (None, "")],
+        plant_health=_plant_health(data.get("plant_health")),
+        extra_info=_text(data.get("extra_info"), ""),
+    )
+
+
+def normalize_confidence(value) -> tuple:
+    """
+    Return (display string, number from 0 to 100) for confidences like "85%", "85", 0.85 or "0.85"
+    """
+    number = None
+    if isinstance(value, bool):
+        value = None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        match = NUMBER_PATTERN.search(value)
+        if match:
+            number = float(match.group())
+
+    if number is None:
+        return (value.strip() if isinstance(value, str) and value.strip() else "0%"), None
+
+    if 0 < number <= 1 and not (isinstance(value, str) and "%" in value):
+        number *= 100 # a fraction; "1%" stays 1 percent
+    number = min(100.0, max(0.0, number))
+    return f"{number:g}%", number
+
+
+def _plant_health(value) -> str:
+    # some responses give health as a score, as in the original fixture ("60%")
+    if isinstance(value, str):
+        is_score = NUMBER_PATTERN.fullmatch(value.strip().rstrip("%").strip()) is not None
+    else:
+        is_score = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if is_score:
+        _, score = normalize_confidence(value)
+        for threshold, label in ((90, "excellent"), (70, "good"), (50, "fair"), (30, "poor")):
+            if score >= threshold:
+                return label
+        return "critical"
+    return _choice(value, PLANT_HEALTH, PLANT_HEALTH_SYNONYMS)
+
+
+def _choice(value, choices: tuple, synonyms: dict) -> str:
+    if not isinstance(value, str):
+        return "Unknown"
+    value = " ".join(value.lower().split())
+    if value in choices:
+        return value
+    return synonyms.get(value, "Unknown")
+
+
+def _text(value, default: str) -> str:
+    if value is None:
+        return default
+    return value if isinstance(value, str) else str(value)
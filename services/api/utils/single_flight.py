@@ -0,0 +1,37 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one.
+
+    The first caller for a key starts the work as a task; callers that arrive while it's
+    still running await the same task and get its result, or its exception. Access happens
+    on the shared event loop, so no thread lock is needed.
+    """
+    def __init__(self):
+        self._inflight = {} # key -> asyncio.Task
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func, *args, **kwargs):
+        """
+        Return the result of `await func(*args, **kwargs)`, sharing one call among concurrent callers with the same key
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        # shield, so a caller timing out doesn't cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
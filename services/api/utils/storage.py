@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalSQLite:
+    """
+    One SQLite connection per thread to a file shared by every worker process, in WAL mode so
+    readers don't block the writer. Extra keyword arguments go to sqlite3.connect, e.g.
+    isolation_level=None for stores that manage their own transactions (BEGIN IMMEDIATE).
+    """
+    def __init__(self, db_path: str, timeout: float = 30, **connect_kwargs):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.connect_kwargs = connect_kwargs
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=self.timeout, **self.connect_kwargs)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+def write_atomic(path: str, data: bytes):
+    """
+    Write a file then rename it into place, so readers (in any process) never see a partial file
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
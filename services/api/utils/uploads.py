@@ -0,0 +1,87 @@
+import io
+import mmap
+import os
+import tempfile
+
+from flask import Request
+
+# uploads bigger than this go straight to a temp file instead of memory
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', 512 * 1024))
+
+
+class UploadRequest(Request):
+    """
+    Request class that spools large file parts straight to an unnamed temp file, so read_upload
+    can map them instead of holding a copy in memory (werkzeug's default keeps parts under
+    500 KB in memory and copies the rest into a SpooledTemporaryFile)
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        size = content_length or total_content_length
+        if size is None or size > UPLOAD_SPOOL_BYTES:
+            return tempfile.TemporaryFile("rb+")
+        return io.BytesIO()
+
+
+def read_upload(file_storage) -> memoryview:
+    """
+    Return the uploaded file's contents as a read-only buffer without copying them.
+
+    File-backed uploads are memory-mapped, so the bytes live in the page cache rather than
+    the Python heap, and the buffer stays valid after the request closes the file.
+    """
+    stream = file_storage.stream
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+
+    if fileno is not None:
+        stream.flush()
+        if os.fstat(fileno).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+
+    if hasattr(stream, 'getvalue'):
+        # BytesIO.getvalue() hands back its internal bytes object when nothing else shares it
+        return memoryview(stream.getvalue())
+    return memoryview(stream.read())
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a bytes-like buffer, for APIs that want a file
+    (Pillow, httpx multipart) where io.BytesIO would copy the whole buffer first
+    """
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        data = bytes(self._view[self._position:end])
+        self._position = max(self._position, end)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
@@ -0,0 +1,286 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open
+    """
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast until `reset_timeout`
+    has passed, then lets a single trial call through (half-open) to decide whether to close again.
+    """
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 5))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv('UPSTREAM_BREAKER_RESET', 30))
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError if calls are blocked; return True if this call is the half-open trial
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def abandon_trial(self):
+        """
+        The trial call was cancelled before it said anything about the upstream; let the next call try
+        """
+        with self._lock:
+            self.trial_in_flight = False
+
+
+class Upstream:
+    """
+    A named upstream dependency: calls go through its circuit breaker and are retried with
+    jittered exponential backoff (honouring Retry-After) when the failure looks transient.
+    """
+    def __init__(self, name: str, max_attempts: int = None, base_delay: float = None, max_delay: float = None,
+                 breaker: CircuitBreaker = None):
+        self.name = name
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv('UPSTREAM_MAX_ATTEMPTS', 3))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv('UPSTREAM_BACKOFF_BASE', 0.5))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('UPSTREAM_BACKOFF_MAX', 10))
+        self.breaker = breaker or CircuitBreaker(name)
+        self.retries = 0
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Await `func(*args, **kwargs)` with retries and circuit breaking
+        """
+        attempt = 1
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # cancelled mid-call: don't leave the breaker waiting on a trial that will never finish
+                if trial:
+                    self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def call_sync(self, func, *args, **kwargs):
+        """
+        Blocking version of call, for code that isn't running on the event loop
+        """
+        attempt = 1
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                if trial:
+                    self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {"state": self.breaker.state, "times_opened": self.breaker.times_opened, "retries": self.retries}
+
+    def record_error(self, error: Exception) -> bool:
+        """
+        Feed a failed call into the circuit breaker and return whether it's worth retrying
+        """
+        if not is_retryable(error):
+            # the upstream answered, it just didn't like the request; that says nothing about its health
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        return True
+
+    def _on_failure(self, error: Exception, attempt: int):
+        """
+        Record the failure and return how long to wait before retrying, or None to give up
+        """
+        if not self.record_error(error) or attempt >= self.max_attempts:
+            return None
+
+        self.retries += 1
+        # full jitter: a random delay up to the exponential cap, but never shorter than Retry-After
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (httpx.TransportError, requests.ConnectionError, requests.Timeout, asyncio.TimeoutError)):
+        return True
+    status_code = _status_code(error)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception):
+    """
+    Parse the Retry-After header (seconds or HTTP date) from the error's response, if there is one
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _status_code(error: Exception):
+    if isinstance(error, genai_errors.APIError):
+        return error.code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+# shared, pooled clients; each is created once per process and reused by every request
+_clients_lock = threading.Lock()
+_genai_client = None
+_async_http_client = None
+_http_session = None
+_upstreams = {}
+
+
+def _timeout() -> float:
+    return float(os.getenv('UPSTREAM_TIMEOUT', 30))
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv('UPSTREAM_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(os.getenv('UPSTREAM_MAX_KEEPALIVE', 20)),
+        keepalive_expiry=float(os.getenv('UPSTREAM_KEEPALIVE_EXPIRY', 60))
+    )
+
+
+def get_upstream(name: str) -> Upstream:
+    with _clients_lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream(name)
+        return _upstreams[name]
+
+
+def get_genai_client() -> genai.Client:
+    """
+    The Gemini client shared by the vision and chat models, with pooled keep-alive connections
+    """
+    global _genai_client
+    with _clients_lock:
+        if _genai_client is None:
+            _genai_client = genai.Client(
+                api_key=os.getenv('GEMINI_API_KEY'),
+                http_options=types.HttpOptions(
+                    timeout=int(_timeout() * 1000), # milliseconds
+                    client_args={'limits': _limits()},
+                    async_client_args={'limits': _limits()}
+                )
+            )
+        return _genai_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Pooled async HTTP client; only use it from the shared event loop (utils/async_runner.py)
+    """
+    global _async_http_client
+    with _clients_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        return _async_http_client
+
+
+def get_http_session() -> requests.Session:
+    """
+    Pooled blocking HTTP session for code running on worker threads
+    """
+    global _http_session
+    with _clients_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=int(os.getenv('UPSTREAM_MAX_KEEPALIVE', 20)))
+            _http_session.mount('http://', adapter)
+            _http_session.mount('https://', adapter)
+        return _http_session
+
+
+def upstream_stats() -> dict:
+    with _clients_lock:
+        return {name: upstream.stats() for name, upstream in _upstreams.items()}
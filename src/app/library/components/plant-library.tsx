@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useMemo, useEffect } from "react"
+import { useState, useEffect, useCallback } from "react"
 import { Input } from "@/components/ui/input"
 import { Button } from "@/components/ui/button"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
@@ -9,79 +9,102 @@ import { PlantCard } from "./plant-card"
 import { PlantDetailModal } from "./plant-detail-modal"
 import { Plant } from "@/app/db/types"
 
+const API_ROUTE_PORT = process.env.NEXT_PUBLIC_API_ROUTE_PORT
+const API_BASE_URL = `http://localhost:${API_ROUTE_PORT}`
+const PAGE_SIZE = 24
+
+interface HistoryPage {
+  items: any[]
+  next_cursor: string | null
+}
 
 export function PlantLibrary() {
   const [plants, setPlants] = useState<Plant[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [isLoading, setIsLoading] = useState(true)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [searchTerm, setSearchTerm] = useState("")
+  const [debouncedSearch, setDebouncedSearch] = useState("")
   const [sortBy, setSortBy] = useState("date")
   const [filterHealth, setFilterHealth] = useState("all")
   const [filterSeverity, setFilterSeverity] = useState("all")
   const [viewMode, setViewMode] = useState<"grid" | "list">("grid")
   const [selectedPlant, setSelectedPlant] = useState<Plant | null>(null)
 
-  // Fetch plants when component mounts
+  // Wait for typing to pause before searching
   useEffect(() => {
-    const fetchPlants = async () => {
-      try {
-        setIsLoading(true)
-        const response = await fetch('/api/plants', {
-          method: 'GET',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-        })
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300)
+    return () => clearTimeout(timer)
+  }, [searchTerm])
 
-        if (!response.ok) {
-          throw new Error('Failed to fetch plants')
-        }
+  // Fetch one page of diagnosis history; filtering and sorting happen on the server
+  const fetchPage = useCallback(async (cursor: string | null): Promise<HistoryPage> => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE), sort: sortBy })
+    if (debouncedSearch) params.set("q", debouncedSearch)
+    if (filterHealth !== "all") params.set("plant_health", filterHealth)
+    if (filterSeverity !== "all") params.set("severity", filterSeverity)
+    if (cursor) params.set("cursor", cursor)
 
-        const data = await response.json()
-        // Convert date strings to Date objects
-        const plantsWithDates = data.map((plant: any) => ({
-          ...plant,
-          date: new Date(plant.date)
-        }))
-        setPlants(plantsWithDates)
-      } catch (err) {
-        setError(err instanceof Error ? err.message : 'An error occurred')
-      } finally {
-        setIsLoading(false)
-      }
+    const response = await fetch(`${API_BASE_URL}/history?${params}`)
+    if (!response.ok) {
+      throw new Error('Failed to fetch plants')
     }
 
-    fetchPlants()
-  }, [])
-
-  const filteredAndSortedPlants = useMemo(() => {
-    const filtered = plants.filter((plant) => {
-        console.log(plant)
-      const matchesSearch =
-        plant.species.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        plant.diagnosis.toLowerCase().includes(searchTerm.toLowerCase())
-
-      const matchesHealth = filterHealth === "all" || plant.plant_health === filterHealth
-      const matchesSeverity = filterSeverity === "all" || plant.severity === filterSeverity
+    const data = await response.json()
+    return {
+      // Convert date strings to Date objects and image paths to URLs on the API server
+      items: data.items.map((plant: any) => ({
+        ...plant,
+        image: plant.image ? `${API_BASE_URL}${plant.image}` : "",
+        date: new Date(plant.date)
+      })),
+      next_cursor: data.next_cursor
+    }
+  }, [debouncedSearch, sortBy, filterHealth, filterSeverity])
 
-      return matchesSearch && matchesHealth && matchesSeverity
-    })
+  // Load the first page whenever the search, sort or filters change
+  useEffect(() => {
+    let ignore = false
 
-    // Sort plants
-    filtered.sort((a, b) => {
-      switch (sortBy) {
-        case "date":
-          return b.date.getTime() - a.date.getTime()
-        case "health":
-          const healthOrder = { excellent: 5, good: 4, fair: 3, poor: 2, critical: 1 }
-          return healthOrder[b.plant_health] - healthOrder[a.plant_health]
-        default:
-          return 0
+    const fetchFirstPage = async () => {
+      try {
+        const page = await fetchPage(null)
+        if (!ignore) {
+          setPlants(page.items)
+          setNextCursor(page.next_cursor)
+          setError(null)
+        }
+      } catch (err) {
+        if (!ignore) {
+          setError(err instanceof Error ? err.message : 'An error occurred')
+        }
+      } finally {
+        if (!ignore) {
+          setIsLoading(false)
+        }
       }
-    })
+    }
+
+    fetchFirstPage()
+    return () => {
+      ignore = true
+    }
+  }, [fetchPage])
 
-    return filtered
-  }, [plants, searchTerm, sortBy, filterHealth, filterSeverity])
+  const loadMore = async () => {
+    if (!nextCursor) return
+    try {
+      setIsLoadingMore(true)
+      const page = await fetchPage(nextCursor)
+      setPlants((current) => [...current, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'An error occurred')
+    } finally {
+      setIsLoadingMore(false)
+    }
+  }
 
   // Add loading state
   if (isLoading) {
@@ -206,12 +229,12 @@ export function PlantLibrary() {
         {/* Stats */}
         <div className="mt-4 flex flex-wrap gap-4 text-sm text-[#558B59]">
           <span>
-            <strong className="text-[#2E7D32]">{filteredAndSortedPlants.length}</strong> plants found
+            <strong className="text-[#2E7D32]">{plants.length}</strong> plants {nextCursor ? "loaded" : "found"}
           </span>
           <span>
             <strong className="text-[#2E7D32]">
               {
-                filteredAndSortedPlants.filter((p) => p.plant_health === "excellent" || p.plant_health === "good")
+                plants.filter((p) => p.plant_health === "excellent" || p.plant_health === "good")
                   .length
               }
             </strong>{" "}
@@ -219,7 +242,7 @@ export function PlantLibrary() {
           </span>
           <span>
             <strong className="text-[#2E7D32]">
-              {filteredAndSortedPlants.filter((p) => p.severity === "high").length}
+              {plants.filter((p) => p.severity === "high").length}
             </strong>{" "}
             need attention
           </span>
@@ -228,7 +251,7 @@ export function PlantLibrary() {
 
       {/* Plants Grid/List */}
       <div className={viewMode === "grid" ? "grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6" : "space-y-4"}>
-        {filteredAndSortedPlants.map((plant) => (
+        {plants.map((plant) => (
           <PlantCard 
             key={plant.id} 
             plant={{
@@ -241,8 +264,23 @@ export function PlantLibrary() {
         ))}
       </div>
 
+      {/* Load More */}
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button
+            onClick={loadMore}
+            disabled={isLoadingMore}
+            variant="outline"
+            className="border-[#4CAF50] text-[#4CAF50] hover:bg-[#E8F5E9]"
+          >
+            {isLoadingMore && <Loader2 className="h-4 w-4 mr-2 animate-spin" />}
+            Load more
+          </Button>
+        </div>
+      )}
+
       {/* Empty State */}
-      {filteredAndSortedPlants.length === 0 && (
+      {plants.length === 0 && (
         <div className="text-center py-12">
           <div className="h-16 w-16 rounded-full bg-[#E8F5E9] flex items-center justify-center mx-auto mb-4">
             <Search className="h-8 w-8 text-[#4CAF50]" />
@@ -33,6 +33,8 @@ export function ChatInterface() {
   const [isLoading, setIsLoading] = useState(false)
   const messagesEndRef = useRef<HTMLDivElement>(null)
   const inputRef = useRef<HTMLInputElement>(null)
+  // conversation ID issued by the chat service, so this conversation keeps its own history
+  const sessionIdRef = useRef<string | null>(null)
 
   const API_ROUTE_PORT = process.env.NEXT_PUBLIC_API_ROUTE_PORT
 
@@ -63,19 +65,37 @@ export function ChatInterface() {
     setInput("")
     setIsLoading(true)
 
-    // AI response
-    setTimeout(async () => {
-      const response = await generateResponse(input)
-      const assistantMessage: Message = {
-        id: (Date.now() + 1).toString(),
-        content: response,
-        role: "assistant",
-        timestamp: new Date(),
-      }
+    // AI response, streamed into the message as tokens arrive
+    const assistantId = (Date.now() + 1).toString()
+    let started = false
 
-      setMessages((prev) => [...prev, assistantMessage])
+    try {
+      await streamResponse(input, (text) => {
+        if (!started) {
+          started = true
+          setIsLoading(false)
+          setMessages((prev) => [...prev, { id: assistantId, content: text, role: "assistant", timestamp: new Date() }])
+        } else {
+          setMessages((prev) =>
+            prev.map((message) => (message.id === assistantId ? { ...message, content: message.content + text } : message)),
+          )
+        }
+      })
+    } catch {
+      if (!started) {
+        setMessages((prev) => [
+          ...prev,
+          {
+            id: assistantId,
+            content: "Sorry, something went wrong. Please try again.",
+            role: "assistant",
+            timestamp: new Date(),
+          },
+        ])
+      }
+    } finally {
       setIsLoading(false)
-    }, 1000)
+    }
   }
 
   const handleImageUpload = (file: File) => {
@@ -112,18 +132,49 @@ export function ChatInterface() {
     reader.readAsDataURL(file)
   }
 
-  // Simple response generator based on keywords
-  const generateResponse = async (query: string): Promise<string> => {
-    // make a request to the chat api route
+  // Stream the chat response over Server-Sent Events, calling onText for each chunk
+  const streamResponse = async (query: string, onText: (text: string) => void): Promise<void> => {
     const response = await fetch(`http://localhost:${API_ROUTE_PORT}/chat`, {
       method: "POST",
-      body: JSON.stringify({ message: query }),
+      body: JSON.stringify({ message: query, session_id: sessionIdRef.current, stream: true }),
       headers: {
         "Content-Type": "application/json",
+        Accept: "text/event-stream",
       },
     })
-    const data = await response.json()
-    return data.response
+    if (!response.ok || !response.body) {
+      throw new Error(`Chat request failed: ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ""
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      // events are separated by a blank line
+      let boundary = buffer.indexOf("\n\n")
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        boundary = buffer.indexOf("\n\n")
+
+        let event = "message"
+        let data = ""
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7)
+          else if (line.startsWith("data: ")) data += line.slice(6)
+        }
+        const payload = data ? JSON.parse(data) : {}
+
+        if (event === "session") sessionIdRef.current = payload.session_id
+        else if (event === "error") throw new Error(payload.error)
+        else if (event === "message" && payload.text) onText(payload.text)
+      }
+    }
   }
 
   return (
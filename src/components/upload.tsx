@@ -11,8 +11,6 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@
 import { ImagePlus, UploadIcon, X, Crop, Loader2 } from "lucide-react"
 import { useRouter } from "next/navigation"
 import { getDatabase } from "@/app/db/dbAdapter"
-import { Plant } from "@/app/db/types"
-import { v4 as uuidv4 } from 'uuid';
 
 export function Upload() {
   const [files, setFiles] = useState<File[]>([])
@@ -121,38 +119,12 @@ export function Upload() {
 
       if (response.ok) {      
         const data = await response.json()
-        const analysisResults = data.analysis
         
         // Download the PDF
         const pdfUrl = `http://localhost:${API_ROUTE_PORT}/download-pdf/${data.pdf_timestamp}`
         window.open(pdfUrl, '_blank')
 
-        // Add the treatment to the database
-        const plant: Plant = {
-          id: uuidv4(),
-          species: analysisResults.plant_species,
-          image: previews[0],
-          diagnosis: analysisResults.disease_detected,
-          treatments: analysisResults.recommendations,
-          confidence: analysisResults.confidence,
-          severity: analysisResults.severity.toLowerCase() as "low" | "medium" | "high",
-          plant_health: analysisResults.plant_health.toLowerCase() as "excellent" | "good" | "fair" | "poor" | "critical",
-          date: new Date(),
-          notes: symptoms
-        }
-
-        // Save plant using the API route
-        const plantResponse = await fetch('/api/plants', {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(plant)
-        })
-
-        if (!plantResponse.ok) {
-          throw new Error('Failed to save plant data')
-        }
+        // The analysis service saves the diagnosis and image to the plant library history itself
 
         // Reset form state
         setFiles([])
@@ -1,4 +1,26 @@
+"""
+Corpus, fuzz run and benchmark for the vision response parser (services/api/utils/response_parser.py).
+
+The corpus holds the kinds of replies seen from the model: fenced JSON, prose around the object,
+trailing commas, braces inside strings, and output cut off mid-object. The fuzzer mutates valid
+replies the same ways and checks that the parser either recovers a normalized analysis or raises
+ResponseParseError, never anything else. The benchmark compares it with the old fence-stripping
+regexes plus json.loads.
+
+Usage: python tests/jsonStripTest.py [--fuzz 5000] [--runs 2000] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
 import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services", "api"))
+
+from utils import response_parser
+from utils.response_parser import PLANT_HEALTH, SEVERITIES, ResponseParseError, parse_analysis
 
 ai_response_content = """
     ```json
@@ -15,10 +37,138 @@ ai_response_content = """
     ```
 """
 
-# remove the ```json and ``` from the response
-if ai_response_content.strip().startswith("```"):
-    # Remove triple backticks and optional 'json' after them
-    ai_response_content = re.sub(r"^```(?:json)?\s*", "", ai_response_content.strip(), flags=re.IGNORECASE)
-    ai_response_content = re.sub(r"\s*```$", "", ai_response_content.strip())
+VALID = {
+    "plant_species": "Solanum lycopersicum",
+    "disease_detected": "Early blight",
+    "confidence": "87%",
+    "severity": "medium",
+    "recommendations": ["Remove affected leaves.", "Apply a copper fungicide {weekly}, e.g. \"Bonide\"."],
+    "plant_health": "fair",
+    "extra_info": "Spores overwinter on debris } so rotate crops.",
+}
+
+# (name, response text, expected disease_detected or None if it should be rejected)
+CORPUS = [
+    ("original fixture", ai_response_content, "Pear leaf spot"),
+    ("bare json", json.dumps(VALID), "Early blight"),
+    ("fenced no language", "```\n" + json.dumps(VALID) + "\n```", "Early blight"),
+    ("prose before and after", "Here is the analysis you asked for:\n" + json.dumps(VALID, indent=2) + "\nLet me know if you need more.", "Early blight"),
+    ("trailing commas", '{"disease_detected": "Rust", "recommendations": ["a", "b",], "confidence": "70%",}', "Rust"),
+    ("truncated in string", json.dumps(VALID)[:-40], "Early blight"),
+    ("truncated in array", '{"disease_detected": "Mildew", "recommendations": ["Prune", "Improve airfl', "Mildew"),
+    ("truncated after key", '{"disease_detected": "Mildew", "severity":', "Mildew"),
+    ("wrapped in array", "[" + json.dumps(VALID) + "]", "Early blight"),
+    ("fraction confidence", '{"disease_detected": "Healthy", "confidence": 0.92, "severity": "low", "plant_health": "excellent"}', "Healthy"),
+    ("no object", "I could not analyze this image.", None),
+    ("empty", "", None),
+    ("missing disease", '{"confidence": "50%"}', None),
+]
+
+
+def legacy_parse(text: str) -> dict:
+    """The parser this module replaced: strip code fences with two regexes, then json.loads"""
+    if text.strip().startswith("```"):
+        text = re.sub(r"^```(?:json)?\s*", "", text.strip(), flags=re.IGNORECASE)
+        text = re.sub(r"\s*```$", "", text.strip())
+    return json.loads(text)
+
+
+def check_analysis(analysis: dict):
+    assert set(analysis) == set(response_parser.PlantAnalysis.__annotations__), sorted(analysis)
+    assert analysis["severity"] in SEVERITIES + ("Unknown",), analysis["severity"]
+    assert analysis["plant_health"] in PLANT_HEALTH + ("Unknown",), analysis["plant_health"]
+    assert analysis["confidence_value"] is None or 0 <= analysis["confidence_value"] <= 100
+    assert all(isinstance(item, str) for item in analysis["recommendations"])
+
+
+def run_corpus() -> int:
+    failures = 0
+    legacy_ok = 0
+    for name, text, expected in CORPUS:
+        try:
+            legacy_parse(text)
+            legacy_ok += 1
+        except ValueError:
+            pass
+        try:
+            analysis, repaired = parse_analysis(text)
+            check_analysis(analysis)
+            result = analysis["disease_detected"]
+        except ResponseParseError:
+            result, repaired = None, False
+        ok = result == expected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<24} -> {result!r}{' (repaired)' if repaired else ''}")
+    print(f"\ncorpus: {len(CORPUS) - failures}/{len(CORPUS)} as expected (legacy parser parsed {legacy_ok}/{len(CORPUS)})")
+    return failures
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    choice = rng.randrange(6)
+    if choice == 0:
+        return text[:rng.randrange(len(text) + 1)] # truncate anywhere
+    if choice == 1:
+        return rng.choice(["Sure! ", "```json\n", "Result:\n", "{note} "]) + text + rng.choice(["", "\n```", " Hope this helps!"])
+    if choice == 2:
+        return re.sub(r"([\]\"}])(\s*)([}\]])", r"\1,\2\3", text, count=rng.randrange(1, 4)) # trailing commas
+    if choice == 3:
+        index = rng.randrange(len(text) + 1)
+        return text[:index] + rng.choice("{}[]\",:\\ ") + text[index:] # stray character
+    if choice == 4:
+        return json.dumps(VALID, indent=rng.choice([None, 2, 4]))
+    return text
+
+
+def run_fuzz(iterations: int, seed: int) -> int:
+    rng = random.Random(seed)
+    seeds = [text for _, text, expected in CORPUS if expected is not None]
+    recovered = rejected = crashed = 0
+    for _ in range(iterations):
+        text = rng.choice(seeds)
+        for _ in range(rng.randrange(1, 4)):
+            text = mutate(rng, text)
+        try:
+            analysis, _ = parse_analysis(text)
+            check_analysis(analysis)
+            recovered += 1
+        except ResponseParseError:
+            rejected += 1
+        except Exception as e:
+            crashed += 1
+            print(f"CRASH {e.__class__.__name__}: {e} on {text[:120]!r}")
+    print(f"fuzz: {iterations} inputs, {recovered} recovered, {rejected} rejected, {crashed} crashed")
+    return crashed
+
+
+def time_per_call(func, text: str, runs: int) -> float:
+    started = time.perf_counter()
+    for _ in range(runs):
+        try:
+            func(text)
+        except ValueError:
+            pass
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def run_benchmark(runs: int):
+    print(f"\nbenchmark ({runs} runs each, orjson {'on' if response_parser.orjson else 'off'}):")
+    for name, text in (("bare json", json.dumps(VALID)), ("fenced", "```json\n" + json.dumps(VALID, indent=2) + "\n```"),
+                       ("truncated", json.dumps(VALID)[:-40])):
+        print(f"  {name:<10} legacy: {time_per_call(legacy_parse, text, runs):7.1f} us   parser: {time_per_call(parse_analysis, text, runs):7.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fuzz", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = run_corpus()
+    failures += run_fuzz(args.fuzz, args.seed)
+    run_benchmark(args.runs)
+    sys.exit(1 if failures else 0)
+
 
-print(ai_response_content)
+if __name__ == "__main__":
+    main()